@@ -63,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PrimaryStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'CyberApp.urls'
@@ -87,6 +88,19 @@ DATABASES = {
     }
 }
 
+# Read replica for reporting reads (core.db_router); set DB_REPLICA_HOST to enable it.
+# A second local PostgreSQL instance works for testing.
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', '5432'),
+        'OPTIONS': {'connect_timeout': 2},  # An unreachable replica falls back to the primary quickly
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -211,3 +225,51 @@ LOGGING = {
     },
 }
 
+
+# Campaign email delivery
+CAMPAIGN_FROM_EMAIL = 'no-reply@cyberapp.com'
+CAMPAIGN_EMAIL_BATCH_SIZE = 100  # Messages sent per pooled connection checkout
+CAMPAIGN_EMAIL_POOL_SIZE = 2     # Long-lived SMTP connections kept open during a send
+CAMPAIGN_EMAIL_THREADS = 8         # Sender threads per dispatch worker
+CAMPAIGN_DOMAIN_RATE = 10          # Messages/second per recipient domain
+CAMPAIGN_DOMAIN_CONNECTIONS = 2    # Concurrent sends per recipient domain
+CAMPAIGN_TENANT_RATE = 50          # Messages/second per client
+CAMPAIGN_TENANT_CONNECTIONS = 4    # Open relay connections per client
+CAMPAIGN_DOMAIN_LIMITS = {}        # Per-domain overrides, e.g. {'gmail.com': {'rate': 5, 'connections': 1}}
+CAMPAIGN_DISPATCH_WORKERS = 1      # dispatch_campaigns processes; the limits above are split between them
+CAMPAIGN_WAVE_SPREAD_SECONDS = 3600  # Longest time one scheduled wave is spread over
+CAMPAIGN_RECIPIENT_CHUNK_SIZE = 2000  # Recipients read per keyset page while sending
+CAMPAIGN_DISPATCH_STALE_SECONDS = 600  # Running jobs silent for this long are reclaimed by another worker
+CAMPAIGN_DISPATCH_HEARTBEAT_SECONDS = 30  # Running jobs report progress at least this often
+CAMPAIGN_BASE_URL = 'http://localhost:8000'  # Used to build absolute tracking links in emails
+CAMPAIGN_TOKEN_MAX_AGE = 60 * 60 * 24 * 180  # Seconds a tracking link keeps recording
+CAMPAIGN_LEGACY_PIXEL_TOKENS = True  # Still track opens from emails sent before links were signed
+CAMPAIGN_RECIPIENT_CACHE_SIZE = 10000  # Recipients remembered by the open pixel...
+CAMPAIGN_RECIPIENT_CACHE_TTL = 300     # ...for this many seconds
+EMAIL_TEMPLATE_CACHE_SIZE = 256  # Compiled template versions kept in memory per process
+
+# Tracking event ingestion (campaigns.events)
+CAMPAIGN_EVENT_BUFFER = True           # False writes each event synchronously
+CAMPAIGN_EVENT_BUFFER_SIZE = 500       # Flush once this many events are buffered...
+CAMPAIGN_EVENT_FLUSH_SECONDS = 1.0     # ...or at least this often
+CAMPAIGN_EVENT_MAX_PENDING = 50000     # Cap on buffered events while the database is unavailable
+
+# PhishingTestLog partitions (campaigns.partitions, `log_partitions` command)
+CAMPAIGN_LOG_PARTITIONS_AHEAD = 3      # Monthly partitions created ahead of time
+CAMPAIGN_LOG_RETENTION_MONTHS = 13     # Older partitions are detached and archived
+CAMPAIGN_LOG_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Result exports (campaigns.exports)
+CAMPAIGN_EXPORT_CHUNK_SIZE = 2000      # Rows fetched per server-side cursor round trip
+
+# Tenant resolution cache (tenants.resolver, used by TenantMiddleware)
+TENANT_CACHE_SIZE = 1024               # Hosts kept per process
+TENANT_CACHE_TTL = 300                 # Seconds before a cached resolution is checked again
+TENANT_SHARED_CACHE = None             # CACHES alias shared by all workers, e.g. 'default' with Redis
+
+# Read replica routing (core.db_router)
+DATABASE_REPLICA = 'replica'           # DATABASES alias reporting reads go to
+REPLICA_STICKY_SECONDS = 15            # Reads stay on the primary this long after a browser writes
+REPLICA_MAX_LAG = 5                    # Seconds behind before reads fall back to the primary
+REPLICA_LAG_CHECK_SECONDS = 2          # How often each process checks the lag
+REPLICA_RETRY_SECONDS = 30             # How long an unreachable replica is left alone
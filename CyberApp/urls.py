@@ -25,6 +25,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('jet/', include('jet.urls', 'jet')),  # JET is being used
     path('jet/dashboard/', include('jet.dashboard.urls', 'jet-dashboard')),
+    path('campaigns/', include('campaigns.urls')),
     #path('mailtemplates/', include('mailtemplates.urls')),
 ]
 
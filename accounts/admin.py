@@ -2,11 +2,14 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group 
 from .models import CustomUser
-from core.admin_mixins import TenantAdminMixin
+from core.admin_mixins import ReplicaChangelistMixin, TenantAdminMixin
 
 @admin.register(CustomUser)
-class CustomUserAdmin(TenantAdminMixin, UserAdmin):
+class CustomUserAdmin(ReplicaChangelistMixin, TenantAdminMixin, UserAdmin):
     list_display = ('username', 'email', 'client', 'is_staff', 'is_active')
+    list_select_related = ('client',)
+    autocomplete_fields = ('groups',)  # Searches CustomGroupAdmin, which is tenant-filtered
+    filter_horizontal = ('user_permissions',)
     
     # Extend the default fieldsets to include your custom fields.
     fieldsets = UserAdmin.fieldsets + (
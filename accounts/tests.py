@@ -1,3 +1,20 @@
 from django.test import TestCase
 
-# Create your tests here.
+from core.testing import ChangelistQueriesMixin, make_client
+from .models import CustomUser
+
+
+class UserChangelistTests(ChangelistQueriesMixin, TestCase):
+    changelist = 'admin:accounts_customuser_changelist'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tenants = [cls.tenant, make_client(2, 'acme')]
+
+    def add_rows(self, count):
+        start = CustomUser.objects.count()
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{i}', email=f'user{i}@example.test', client=self.tenants[i % 2])
+            for i in range(start, start + count)
+        ])
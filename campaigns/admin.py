@@ -1,15 +1,20 @@
-print("campaigns/admin.py loaded")
-
 from django.contrib import admin
 from .models import Campaign, PhishingTestLog
-from core.admin_mixins import TenantAdminMixin  # Confirm correct import
+from core.admin_mixins import ReplicaChangelistMixin, TenantAdminMixin  # Confirm correct import
+from core.pagination import KeysetPaginationMixin
+from .scheduler import schedule_campaign
+from .exports import export_queryset, export_response
 
 
 @admin.register(Campaign)
-class CampaignAdmin(TenantAdminMixin, admin.ModelAdmin):
+class CampaignAdmin(ReplicaChangelistMixin, TenantAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'start_date', 'end_date', 'number_of_emails', 'created_at')
     search_fields = ('title',)
-    filter_horizontal = ('groups', 'templates',)  # For easier selection in the admin
+    ordering = ('-start_date',)  # Served by campaigns_client_start_idx
+    # Select2 widgets searching the group and template admins (tenant-filtered, prefix-indexed)
+    # instead of rendering every eligible row into the page
+    autocomplete_fields = ('groups', 'templates')
+    actions = ('export_results_csv', 'export_results_ndjson')
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -23,8 +28,26 @@ class CampaignAdmin(TenantAdminMixin, admin.ModelAdmin):
         if db_field.name == "templates":
             if request.user.client.pk != 1:
                 kwargs["queryset"] = db_field.related_model.objects.filter(client=request.user.client)
+        # Same for "groups", matching what the group autocomplete offers
+        if db_field.name == "groups":
+            if request.user.client.pk != 1:
+                kwargs["queryset"] = db_field.related_model.objects.filter(tenant_data__client=request.user.client)
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Keep the drip schedule in line with the dates and number of emails
+        schedule_campaign(obj)
+
+    @admin.action(description="Export results of selected campaigns (CSV)")
+    def export_results_csv(self, request, queryset):
+        # `queryset` already went through get_queryset, so it's limited to the user's client
+        return export_response(export_queryset(request.user, queryset), 'csv')
+
+    @admin.action(description="Export results of selected campaigns (NDJSON, gzip)")
+    def export_results_ndjson(self, request, queryset):
+        return export_response(export_queryset(request.user, queryset), 'ndjson', compress=True)
+
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -32,7 +55,9 @@ class CampaignAdmin(TenantAdminMixin, admin.ModelAdmin):
 #admin.site.register(Campaign, CampaignAdmin)
 
 @admin.register(PhishingTestLog)
-class PhishingTestLogAdmin(admin.ModelAdmin):
-    list_display = ('user', 'campaign', 'action', 'timestamp')
+class PhishingTestLogAdmin(ReplicaChangelistMixin, KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ('user', 'campaign', 'action', 'timestamp', 'last_seen', 'hits')
+    list_select_related = ('user', 'campaign')
+    keyset_fields = ('-timestamp', '-id')  # Newest first; served by campaigns_log_keyset_idx
     list_filter = ('action', 'campaign')
     search_fields = ('user__username',)
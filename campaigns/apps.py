@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CampaignsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'campaigns'
+
+    def ready(self):
+        from django.db.models.signals import pre_delete
+        from mailtemplates.models import EmailTemplate
+        from .stats import fold_template_stats
+        # The rollups key deleted templates as NULL; merge into that row rather than collide with it
+        pre_delete.connect(fold_template_stats, sender=EmailTemplate, dispatch_uid='campaigns.stats.fold_template')
@@ -0,0 +1,245 @@
+"""
+Delivery layer for campaign emails.
+
+Messages are built from prebuilt MIME skeletons, grouped in batches and sent over a
+small pool of long-lived backend connections, so the SMTP handshake (TLS + login)
+is paid once per connection instead of once per recipient. send_concurrently()
+spreads the batches over a thread pool within per-domain and per-tenant limits.
+"""
+import logging
+import queue
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .mime import get_skeleton
+from .throttle import domain_limit, tenant_limit
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from settings.py
+BATCH_SIZE = getattr(settings, 'CAMPAIGN_EMAIL_BATCH_SIZE', 100)
+POOL_SIZE = getattr(settings, 'CAMPAIGN_EMAIL_POOL_SIZE', 2)
+RECONNECT_ATTEMPTS = getattr(settings, 'CAMPAIGN_EMAIL_RECONNECT_ATTEMPTS', 2)
+FROM_EMAIL = getattr(settings, 'CAMPAIGN_FROM_EMAIL', 'no-reply@cyberapp.com')
+SENDER_THREADS = getattr(settings, 'CAMPAIGN_EMAIL_THREADS', 8)
+PROGRESS_INTERVAL = getattr(settings, 'CAMPAIGN_EMAIL_PROGRESS_SECONDS', 30)
+
+
+class ConnectionPool:
+    """
+    Hands out open email backend connections and takes them back for reuse.
+    At most `size` connections are opened; callers block when all are in use.
+    """
+
+    def __init__(self, size=None, **connection_kwargs):
+        self.size = size or POOL_SIZE
+        self.connection_kwargs = connection_kwargs
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return get_connection(fail_silently=False, **self.connection_kwargs)
+        return self._idle.get()
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                logger.warning("Error closing pooled email connection", exc_info=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_message(template, recipient_email, from_email=None, context=None):
+    """
+    Builds the EmailMessage for one recipient from an EmailTemplate, filling
+    merge fields such as {{ first_name }} from `context`. The message is
+    assembled from the template's prebuilt MIME skeleton (see campaigns.mime).
+    """
+    skeleton = get_skeleton(template, template.sender or from_email or FROM_EMAIL)
+    return skeleton.message(recipient_email, context or {'email': recipient_email})
+
+
+def batched(iterable, size=None):
+    """Yields lists of at most `size` items from `iterable`."""
+    size = size or BATCH_SIZE
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def send_batch(pool, email_messages, before_send=None):
+    """
+    Sends a batch of messages over one pooled connection.
+    The connection stays open across the batch; if the server drops it, it is
+    reopened and the current message retried. `before_send(message)` is called
+    ahead of each message (used for rate limiting). Returns (sent, failed) where
+    `sent` is the list of delivered messages and `failed` a list of
+    (message, exception) pairs.
+    """
+    sent = []
+    failed = []
+    connection = pool.acquire()
+    try:
+        for message in email_messages:
+            if before_send is not None:
+                before_send(message)
+            for attempt in range(RECONNECT_ATTEMPTS + 1):
+                try:
+                    # open() is a no-op while the connection is alive
+                    connection.open()
+                    if connection.send_messages([message]):
+                        sent.append(message)
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    logger.info("SMTP connection dropped, reconnecting (attempt %s)", attempt + 1)
+                    _reset(connection)
+                    if attempt == RECONNECT_ATTEMPTS:
+                        failed.append((message, e))
+                except Exception as e:
+                    failed.append((message, e))
+                    break
+    finally:
+        pool.release(connection)
+    return sent, failed
+
+
+def recipient_domain(email_message):
+    return email_message.to[0].rpartition('@')[2].lower()
+
+
+def send_concurrently(email_messages, client_id, on_progress=None, threads=None, rate=None,
+                      progress_interval=None, clock=time.monotonic, sleep=time.sleep, **connection_kwargs):
+    """
+    Sends messages on a thread pool, honoring the per-domain and per-tenant
+    limits from campaigns.throttle. Each batch is split by recipient domain and
+    every domain batch goes out on one pooled relay connection.
+
+    `rate` spreads the sends out to that many messages per second; paced
+    messages are handed to the pool as they come due instead of in full batches.
+
+    `on_progress(sent, failed)` is called on the calling thread with each
+    finished batch's result lists (see send_batch) as soon as it is collected,
+    and with empty lists whenever `progress_interval` seconds pass without one,
+    so callers can keep a heartbeat through a long paced send. `clock` and
+    `sleep` time the pacing and can be replaced in tests. Extra keyword
+    arguments go to get_connection(). Returns the number of messages sent and failed.
+    """
+    threads = threads or SENDER_THREADS
+    interval = progress_interval or PROGRESS_INTERVAL
+    gap = 1 / rate if rate else 0
+    tenant = tenant_limit(client_id)
+    total_sent = 0
+    total_failed = 0
+    pending = set()
+    last_report = clock()
+
+    def report(sent, failed):
+        nonlocal last_report
+        last_report = clock()
+        if on_progress is not None:
+            on_progress(sent, failed)
+
+    def collect(timeout):
+        # Waits up to `timeout` seconds for batches to finish and reports them
+        nonlocal pending, total_sent, total_failed
+        timeout = max(0, min(timeout, last_report + interval - clock()))
+        if pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        else:
+            done = ()
+            sleep(timeout)
+        for future in done:
+            sent, failed = future.result()
+            total_sent += len(sent)
+            total_failed += len(failed)
+            report(sent, failed)
+        # Same arithmetic as the timeout above, so a zero timeout always reports
+        if clock() >= last_report + interval:
+            report([], [])
+
+    def collect_until(deadline):
+        while clock() < deadline:
+            collect(deadline - clock())
+
+    with ConnectionPool(size=tenant.connections, **connection_kwargs) as pool, ThreadPoolExecutor(max_workers=threads) as executor:
+        def submit(batch):
+            by_domain = defaultdict(list)
+            for message in batch:
+                by_domain[recipient_domain(message)].append(message)
+            for domain, domain_batch in by_domain.items():
+                pending.add(executor.submit(_send_domain_batch, pool, tenant, domain_limit(domain), domain_batch))
+            batch.clear()
+            collect(0)
+
+        batch = []
+        next_at = clock()
+        for message in email_messages:
+            if gap:
+                if next_at > clock():
+                    # Hand over what is already due, then wait for this message's slot
+                    if batch:
+                        submit(batch)
+                    collect_until(next_at)
+                next_at = max(next_at, clock()) + gap
+            batch.append(message)
+            if len(batch) >= BATCH_SIZE:
+                submit(batch)
+            # Keep a bounded number of batches in flight so memory stays flat
+            while len(pending) >= threads * 2:
+                collect(interval)
+        if batch:
+            submit(batch)
+        while pending:
+            collect(interval)
+    return total_sent, total_failed
+
+
+def _send_domain_batch(pool, tenant, domain, email_messages):
+    def throttle(message):
+        domain.rate.acquire()
+        tenant.rate.acquire()
+
+    # Slots are always taken domain first, then tenant, so threads can't deadlock
+    with domain, tenant:
+        return send_batch(pool, email_messages, before_send=throttle)
+
+
+def _reset(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+    # Force the SMTP backend to open a fresh socket on the next open() call
+    if hasattr(connection, 'connection'):
+        connection.connection = None
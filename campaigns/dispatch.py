@@ -0,0 +1,193 @@
+"""
+Database-backed dispatch queue for campaign sends.
+
+The staff view only enqueues a DispatchJob; one or more `dispatch_campaigns`
+workers claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, so several
+workers can run side by side without picking up the same job.
+
+Every message is recorded in the OutboundMessage ledger before it is sent, so a
+job that was interrupted can be claimed again and only sends what is left.
+"""
+import logging
+import os
+import socket
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from mailtemplates.rendering import USER_FIELDS
+from .delivery import batched, build_message, send_concurrently
+from .models import DispatchJob, OutboundMessage
+from .recipients import iter_keyset, set_state, snapshot_recipients
+from .tokens import tracking_links
+
+logger = logging.getLogger(__name__)
+
+# Running jobs report progress at least this often, even while a paced wave is idle
+HEARTBEAT_SECONDS = getattr(settings, 'CAMPAIGN_DISPATCH_HEARTBEAT_SECONDS', 30)
+# A running job that hasn't reported progress for this long is assumed dead and reclaimed.
+# Never less than several heartbeats, so a slow but live job isn't taken over.
+STALE_AFTER = timedelta(seconds=max(getattr(settings, 'CAMPAIGN_DISPATCH_STALE_SECONDS', 600), HEARTBEAT_SECONDS * 5))
+
+# Recipient columns read per row: ledger keys, then the user's merge fields
+RECIPIENT_ROW = ('pk', 'template_id', 'user_id') + tuple(f'user__{field}' for field in USER_FIELDS)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(campaign, requested_by=None):
+    """
+    Queues a send for `campaign` and returns the new job, or None when the
+    campaign already has a queued or running job.
+    """
+    try:
+        with transaction.atomic():
+            return DispatchJob.objects.create(campaign=campaign, requested_by=requested_by)
+    except IntegrityError:
+        return None
+
+
+def claim_job(worker=None):
+    """
+    Claims the oldest queued job (or a running one whose worker went silent),
+    or returns None when there is nothing to do. Rows locked by another worker
+    are skipped instead of waited on.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            DispatchJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='queued') | Q(status='running', heartbeat_at__lt=now - STALE_AFTER))
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == 'running':
+            logger.warning("Reclaiming stale dispatch job %s from %s", job.pk, job.worker)
+        job.status = 'running'
+        job.worker = worker or worker_name()
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def run_job(job):
+    """Sends every email for the job's campaign, recording progress per batch."""
+    campaign = job.campaign
+    wave = job.wave_number
+    try:
+        # The audience is frozen the first time the campaign goes out
+        if not campaign.recipients.exists():
+            snapshot_recipients(campaign)
+        campaign_templates = {template.pk: template for template in campaign.templates.all()}
+        if not campaign_templates or not campaign.recipients.exists():
+            _finish(job, 'failed', "No recipients or no email templates for this campaign.")
+            return
+
+        # Skip everyone this wave already reached, so a rerun only pays for the remainder
+        delivered = OutboundMessage.objects.filter(
+            recipient=OuterRef('pk'), wave=wave, state__in=['sent', 'bounced'],
+        )
+        remaining = campaign.recipients.filter(~Exists(delivered))
+        total = remaining.count()
+        DispatchJob.objects.filter(pk=job.pk).update(queued=total, sent=0, failed=0)
+
+        # Recipients whose template was removed from the campaign get a stable replacement
+        fallback = sorted(campaign_templates.values(), key=lambda template: template.pk)
+        rows = iter_keyset(remaining, RECIPIENT_ROW)
+        outgoing = _ledger_messages(job, wave, rows, campaign_templates, fallback)
+        rate = None
+        if job.send_until:
+            # Scheduled waves are spread out until send_until instead of sent as one burst
+            seconds_left = (job.send_until - timezone.now()).total_seconds()
+            if seconds_left > 0 and total:
+                rate = total / seconds_left
+
+        def progress(sent, failed):
+            now = timezone.now()
+            if sent:
+                sent_ids = [m.recipient_id for m in sent]
+                OutboundMessage.objects.filter(wave=wave, recipient_id__in=sent_ids).update(
+                    state='sent', sent_at=now, attempts=F('attempts') + 1, error='',
+                )
+                set_state(sent_ids, 'sent', sent_count=F('sent_count') + 1, last_sent_at=now)
+            if failed:
+                _record_failures(wave, [(message.recipient_id, e) for message, e in failed])
+            DispatchJob.objects.filter(pk=job.pk).update(
+                sent=F('sent') + len(sent),
+                failed=F('failed') + len(failed),
+                heartbeat_at=now,
+            )
+
+        # progress() also runs every HEARTBEAT_SECONDS with nothing new, keeping the job claimed
+        send_concurrently(
+            outgoing, campaign.client_id, on_progress=progress, rate=rate, progress_interval=HEARTBEAT_SECONDS,
+        )
+    except Exception as e:
+        logger.exception("Dispatch job %s failed", job.pk)
+        _finish(job, 'failed', str(e))
+        return
+    _finish(job, 'done')
+
+
+def _ledger_messages(job, wave, rows, campaign_templates, fallback):
+    """
+    Turns recipient rows into messages, writing a pending ledger entry for each
+    batch before it is handed to the sender. Recipients whose message can't be
+    built (e.g. an invalid address) are marked failed instead of stopping the job.
+    """
+    campaign = job.campaign
+    for batch in batched(rows):
+        OutboundMessage.objects.bulk_create(
+            [OutboundMessage(campaign=campaign, recipient_id=row[0], wave=wave) for row in batch],
+            ignore_conflicts=True,  # Entries left pending or failed by an earlier attempt are reused
+        )
+        messages = []
+        failures = []
+        for pk, template_id, user_id, *user_values in batch:
+            # Links carry a signed (campaign, user) token, so landing pages need no login
+            context = dict(zip(USER_FIELDS, user_values), **tracking_links(campaign.pk, user_id))
+            template = campaign_templates.get(template_id) or fallback[pk % len(fallback)]
+            try:
+                message = build_message(template, context['email'], context=context)
+            except Exception as e:
+                failures.append((pk, e))
+                continue
+            message.recipient_id = pk  # Lets progress updates find the ledger and recipient rows
+            messages.append(message)
+        if failures:
+            _record_failures(wave, failures)
+            DispatchJob.objects.filter(pk=job.pk).update(failed=F('failed') + len(failures))
+        yield from messages
+
+
+def _record_failures(wave, failures):
+    """
+    Marks the ledger and recipient rows of `failures`, a list of
+    (recipient id, exception), as failed: one UPDATE per distinct error.
+    """
+    by_error = defaultdict(list)
+    for recipient_id, e in failures:
+        by_error[str(e)].append(recipient_id)
+    for error, recipient_ids in by_error.items():
+        logger.warning("Error sending email to %s recipient(s): %s", len(recipient_ids), error)
+        OutboundMessage.objects.filter(wave=wave, recipient_id__in=recipient_ids).update(
+            state='failed', attempts=F('attempts') + 1, error=error,
+        )
+    set_state([recipient_id for recipient_id, _ in failures], 'failed')
+
+
+def _finish(job, status, error=''):
+    DispatchJob.objects.filter(pk=job.pk).update(
+        status=status,
+        error=error,
+        finished_at=timezone.now(),
+    )
@@ -0,0 +1,290 @@
+"""
+Write-behind ingestion of PhishingTestLog events.
+
+Tracking views hand events to an in-process buffer and return immediately. A
+background thread writes them once the buffer reaches
+CAMPAIGN_EVENT_BUFFER_SIZE events or every CAMPAIGN_EVENT_FLUSH_SECONDS, and
+whatever is left is flushed when the process exits. If the database is
+unavailable the events are kept for the next attempt, up to
+CAMPAIGN_EVENT_MAX_PENDING, after which the oldest are dropped and logged
+rather than growing without bound. Events the database rejects (e.g. for a
+campaign deleted since) are narrowed down by splitting the batch and dropped,
+so they can't hold back the rest.
+
+PhishingTestLog keeps one row per (user, campaign, action): repeated hits are
+folded together in the buffer and merged into the existing row, so writes grow
+with distinct users rather than with page refreshes.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Campaign, CampaignRecipient, CampaignStat, PhishingTestLog, TemplateStat
+from .partitions import retained_since
+
+logger = logging.getLogger(__name__)
+
+BUFFER_ENABLED = getattr(settings, 'CAMPAIGN_EVENT_BUFFER', True)
+BUFFER_SIZE = getattr(settings, 'CAMPAIGN_EVENT_BUFFER_SIZE', 500)
+FLUSH_SECONDS = getattr(settings, 'CAMPAIGN_EVENT_FLUSH_SECONDS', 1.0)
+MAX_PENDING = getattr(settings, 'CAMPAIGN_EVENT_MAX_PENDING', 50000)
+
+
+class EventBuffer:
+    def __init__(self, size=BUFFER_SIZE, interval=FLUSH_SECONDS, max_pending=MAX_PENDING):
+        self.size = size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def add(self, event):
+        self._ensure_thread()
+        with self._lock:
+            self._events.append(event)
+            overflow = len(self._events) - self.max_pending
+            if overflow > 0:
+                del self._events[:overflow]
+                logger.error("Event buffer full, dropped %s event(s)", overflow)
+            if len(self._events) >= self.size:
+                self._wakeup.set()
+
+    def flush(self):
+        """Writes all buffered events. Safe to call from any thread. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._events = self._events, []
+            written = 0
+            parts = [batch] if batch else []
+            while parts:
+                part = parts.pop()
+                try:
+                    self.write(part)
+                except IntegrityError:
+                    # Bad data rather than a database outage: split until the culprit is alone
+                    if len(part) > 1:
+                        middle = len(part) // 2
+                        parts += [part[middle:], part[:middle]]
+                    else:
+                        logger.exception("Dropping event the database rejects: %r", part[0])
+                except Exception:
+                    unwritten = [event for chunk in [part, *reversed(parts)] for event in chunk]
+                    logger.exception("Failed to flush %s event(s); keeping them for the next attempt", len(unwritten))
+                    self._requeue(unwritten)
+                    break
+                else:
+                    written += len(part)
+            return written
+
+    def _requeue(self, events):
+        with self._lock:
+            self._events[:0] = events
+            overflow = len(self._events) - self.max_pending
+            if overflow > 0:
+                del self._events[:overflow]
+                logger.error("Event buffer full, dropped %s event(s)", overflow)
+
+    def write(self, batch):
+        # Events from the open pixel only carry the recipient token; resolve them all in one query
+        tokens = {event['token'] for event in batch if 'token' in event}
+        if tokens:
+            recipients = {
+                token: (campaign_id, user_id)
+                for token, campaign_id, user_id in CampaignRecipient.objects.filter(token__in=tokens)
+                    .values_list('token', 'campaign_id', 'user_id')
+            }
+            resolved = []
+            for event in batch:
+                if 'token' in event:
+                    if event['token'] not in recipients:
+                        continue  # Unknown or forged token
+                    event = dict(event)
+                    event['campaign_id'], event['user_id'] = recipients[event.pop('token')]
+                resolved.append(event)
+            batch = resolved
+        # Links and pixels can outlive their campaign or user; skip those events up front
+        campaign_ids = {event['campaign_id'] for event in batch}
+        user_ids = {event['user_id'] for event in batch}
+        campaigns = set(Campaign.objects.filter(pk__in=campaign_ids).values_list('pk', flat=True))
+        users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        upsert([event for event in batch if event['campaign_id'] in campaigns and event['user_id'] in users])
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork, so each worker process starts its own flusher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            threading.Thread(target=self._run, name='campaign-event-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+# Advisory lock namespace for log writes: upserts hold it shared and lock
+# (UPSERT_LOCK_ID, hash of campaign and user) per key; rollup rebuilds hold it exclusively
+UPSERT_LOCK_ID = 7301541
+
+
+def upsert(events):
+    """
+    Folds events into one row per (user, campaign, action), keeping the first
+    timestamp, the latest last_seen and the total number of hits, and adds them
+    to the daily CampaignStat totals (and new users to TemplateStat, under the
+    template they were sent) in the same statement.
+
+    The log table is partitioned on timestamp, and Postgres can't enforce a
+    unique constraint that leaves out the partition key, so there is nothing for
+    INSERT ... ON CONFLICT to target. Instead existing rows are updated and the
+    rest inserted in one statement, holding a transaction-level advisory lock
+    per (campaign, user) so two flushing processes can't insert the same key
+    concurrently, while flushes touching different users run in parallel. The
+    locks, and the rollup rows, are taken in a fixed order so concurrent
+    flushes can't deadlock.
+    """
+    rows = {}
+    for event in events:
+        key = (event['user_id'], event['campaign_id'], event['action'])
+        row = rows.get(key)
+        if row is None:
+            rows[key] = [event['timestamp'], event['timestamp'], 1]
+        else:
+            row[0] = min(row[0], event['timestamp'])
+            row[1] = max(row[1], event['timestamp'])
+            row[2] += 1
+    if not rows:
+        return
+    since = retained_since()
+    table = PhishingTestLog._meta.db_table
+    stats_table = CampaignStat._meta.db_table
+    template_stats_table = TemplateStat._meta.db_table
+    recipients_table = CampaignRecipient._meta.db_table
+    values = ', '.join(['(%s::bigint, %s::bigint, %s::varchar, %s::timestamptz, %s::timestamptz, %s::integer)'] * len(rows))
+    # Each touched log row reports its first-seen time, its new hits and whether it is a new user;
+    # the rollup is bucketed by first-seen day so it always matches a GROUP BY over the log.
+    sql = f"""
+        WITH incoming (user_id, campaign_id, action, timestamp, last_seen, hits) AS (VALUES {values}),
+        updated AS (
+            UPDATE {table} AS log
+               SET last_seen = GREATEST(log.last_seen, incoming.last_seen),
+                   hits = log.hits + incoming.hits
+              FROM incoming
+             WHERE log.user_id = incoming.user_id
+               AND log.campaign_id = incoming.campaign_id
+               AND log.action = incoming.action
+               {'AND log.timestamp >= %s::date' if since else ''}
+         RETURNING log.user_id, log.campaign_id, log.action, log.timestamp, incoming.hits, 0 AS users
+        ),
+        inserted AS (
+            INSERT INTO {table} (user_id, campaign_id, action, timestamp, last_seen, hits)
+            SELECT * FROM incoming
+             WHERE NOT EXISTS (
+                SELECT 1 FROM updated
+                 WHERE updated.user_id = incoming.user_id
+                   AND updated.campaign_id = incoming.campaign_id
+                   AND updated.action = incoming.action
+             )
+         RETURNING user_id, campaign_id, action, timestamp, hits, 1 AS users
+        ),
+        by_template AS (
+            INSERT INTO {template_stats_table} AS stat (campaign_id, template_id, action, day, users)
+            SELECT inserted.campaign_id, recipient.template_id, inserted.action, inserted.timestamp::date, count(*)
+              FROM inserted
+              JOIN {recipients_table} AS recipient
+                ON recipient.campaign_id = inserted.campaign_id AND recipient.user_id = inserted.user_id
+             GROUP BY inserted.campaign_id, recipient.template_id, inserted.action, inserted.timestamp::date
+             ORDER BY 1, 2, 3, 4
+            ON CONFLICT (campaign_id, template_id, action, day) DO UPDATE
+               SET users = stat.users + EXCLUDED.users
+        )
+        INSERT INTO {stats_table} AS stat (campaign_id, action, day, users, hits)
+        SELECT campaign_id, action, timestamp::date, sum(users), sum(hits)
+          FROM (SELECT * FROM updated UNION ALL SELECT * FROM inserted) AS touched
+         GROUP BY campaign_id, action, timestamp::date
+         ORDER BY 1, 2, 3
+        ON CONFLICT (campaign_id, action, day) DO UPDATE
+           SET users = stat.users + EXCLUDED.users,
+               hits = stat.hits + EXCLUDED.hits
+    """
+    params = [value for key, row in rows.items() for value in (*key, *row)]
+    if since:
+        # Months before it were archived, so only the retained partitions are searched for existing rows
+        params.append(since)
+    keys = sorted({f'{campaign_id}:{user_id}' for user_id, campaign_id, action in rows})
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [UPSERT_LOCK_ID])
+        # Sorted by the lock key itself, so keys whose hashes collide still lock in one order
+        cursor.execute(
+            """
+            SELECT pg_advisory_xact_lock(%s, key)
+              FROM (SELECT DISTINCT hashtext(name) AS key FROM unnest(%s::text[]) AS keys (name)) AS hashed
+             ORDER BY key
+            """,
+            [UPSERT_LOCK_ID, keys],
+        )
+        cursor.execute(sql, params)
+
+
+buffer = EventBuffer()
+atexit.register(buffer.flush)
+
+
+def record_event(user_id, campaign_id, action):
+    """Records a tracking event without waiting for the database."""
+    _record(_event(user_id, campaign_id, action))
+
+
+def record_token_event(token, action):
+    """Records an event for the CampaignRecipient `token`, resolved when the buffer is flushed."""
+    _record({'token': token, 'action': action, 'timestamp': timezone.now()})
+
+
+async def arecord_event(user_id, campaign_id, action):
+    """record_event for async views; never blocks the event loop."""
+    await _arecord(_event(user_id, campaign_id, action))
+
+
+async def arecord_token_event(token, action):
+    await _arecord({'token': token, 'action': action, 'timestamp': timezone.now()})
+
+
+def _event(user_id, campaign_id, action):
+    return {
+        'user_id': user_id,
+        'campaign_id': campaign_id,
+        'action': action,
+        'timestamp': timezone.now(),
+    }
+
+
+def _record(event):
+    if not BUFFER_ENABLED:
+        buffer.write([event])
+        return
+    buffer.add(event)
+
+
+async def _arecord(event):
+    if not BUFFER_ENABLED:
+        # Unbuffered writes hit the database, so they leave the event loop
+        await sync_to_async(buffer.write)([event])
+        return
+    buffer.add(event)  # In-memory append; the flusher thread does the I/O
@@ -0,0 +1,60 @@
+import time
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+
+from campaigns import delivery
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures campaign email throughput against a local SMTP sink, "
+        "e.g. `python -m aiosmtpd -n -l localhost:1025` with --port 1025."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help="Number of messages to send per run.")
+        parser.add_argument('--domains', type=int, default=20, help="Number of distinct recipient domains.")
+        parser.add_argument('--host', default='localhost', help="SMTP sink host.")
+        parser.add_argument('--port', type=int, default=1025, help="SMTP sink port.")
+        parser.add_argument('--threads', type=int, default=None, help="Sender threads for the concurrent run.")
+
+    def handle(self, *args, **options):
+        connection_kwargs = {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': options['host'],
+            'port': options['port'],
+            'use_tls': False,
+            'username': '',
+            'password': '',
+        }
+
+        def outgoing():
+            for i in range(options['messages']):
+                message = EmailMessage(
+                    subject="Benchmark",
+                    body="<p>Benchmark message</p>",
+                    from_email=delivery.FROM_EMAIL,
+                    to=[f"user{i}@domain{i % options['domains']}.test"],
+                )
+                message.content_subtype = 'html'
+                yield message
+
+        # Sequential: one pooled connection, one message at a time
+        started = time.perf_counter()
+        sent = 0
+        with delivery.ConnectionPool(size=1, **connection_kwargs) as pool:
+            for batch in delivery.batched(outgoing()):
+                sent += len(delivery.send_batch(pool, batch)[0])
+        self._report("sequential", sent, time.perf_counter() - started)
+
+        # Concurrent: thread pool within the per-domain/per-tenant limits
+        started = time.perf_counter()
+        sent, failed = delivery.send_concurrently(
+            outgoing(), client_id='benchmark', threads=options['threads'], **connection_kwargs
+        )
+        self._report("concurrent", sent, time.perf_counter() - started)
+
+    def _report(self, label, sent, elapsed):
+        rate = sent / elapsed if elapsed else 0
+        self.stdout.write(f"{label:>11}: {sent} messages in {elapsed:.2f}s ({rate:.0f} msg/s)")
@@ -0,0 +1,106 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from campaigns.models import Campaign, PhishingTestLog
+from mailtemplates.models import EmailTemplate
+from tenants.models import Client
+
+
+def plan_indexes(plan):
+    """Every "Index Name" in an EXPLAIN (FORMAT JSON) plan tree."""
+    names = [plan['Index Name']] if 'Index Name' in plan else []
+    for child in plan.get('Plans', ()):
+        names += plan_indexes(child)
+    return names
+
+
+def root_index(cursor, name):
+    # A partition's index reports under its own name; map it to the parent's
+    cursor.execute(
+        'SELECT coalesce(pg_partition_root(c.oid), c.oid)::regclass::text FROM pg_class c WHERE c.relname = %s',
+        [name],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else name
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAINs the hot admin and view queries, checks each one uses the index "
+        "added for it, and times them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, help="Client to filter by (default: first one that isn't the superadmin).")
+        parser.add_argument('--campaign', type=int, help="Campaign to filter the log by (default: the client's latest).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query.")
+        parser.add_argument('--no-seqscan', action='store_true',
+                            help="Discourage sequential scans, so the checks mean something on small dev databases.")
+
+    def queries(self, client, campaign):
+        # (expected index, label, queryset) in the order the admin/views issue them
+        return [
+            ('campaigns_client_start_idx', 'campaign changelist',
+             Campaign.objects.filter(client=client).order_by('-start_date')[:100]),
+            ('mailtemplates_client_name_idx', 'template changelist/autocomplete',
+             EmailTemplate.objects.filter(client=client).order_by('name')[:20]),
+            ('mailtemplates_name_prefix_idx', 'template prefix search',
+             EmailTemplate.objects.filter(name__istartswith='a')[:20]),
+            ('tenants_group_client_idx', 'tenant groups',
+             Group.objects.filter(tenant_data__client=client).values_list('pk', flat=True)),
+            ('tenants_group_name_prefix_idx', 'group prefix search',
+             Group.objects.filter(name__istartswith='a')[:20]),
+            ('campaigns_log_timeline_idx', 'log changelist by campaign and action',
+             PhishingTestLog.objects.filter(campaign=campaign, action='clicked').order_by('-timestamp', '-id')[:100]),
+            ('campaigns_log_keyset_idx', 'log changelist',
+             PhishingTestLog.objects.order_by('-timestamp', '-id')[:100]),
+            ('campaigns_log_action_idx', 'event upsert lookup',
+             PhishingTestLog.objects.filter(campaign=campaign, user_id=1, action='clicked')),
+        ]
+
+    def handle(self, *args, **options):
+        if options['client']:
+            client = Client.objects.get(pk=options['client'])
+        else:
+            client = Client.objects.exclude(pk=1).first() or Client.objects.get(pk=1)
+        campaign = options['campaign'] or (
+            Campaign.objects.filter(client=client).order_by('-start_date').values_list('pk', flat=True).first() or 0
+        )
+        self.stdout.write(f"client {client.pk}, campaign {campaign}")
+
+        failures = []
+        # Nothing is written; the transaction only scopes SET LOCAL
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['no_seqscan']:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for expected, label, queryset in self.queries(client, campaign):
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = {root_index(cursor, name) for name in plan_indexes(plan[0]['Plan'])}
+
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append(time.perf_counter() - started)
+
+                ok = expected in used
+                if not ok:
+                    failures.append(label)
+                status = self.style.SUCCESS(f"{'ok':>7}") if ok else self.style.ERROR('MISSING')
+                self.stdout.write(
+                    f"{status} {label:<40} {statistics.median(timings) * 1000:8.2f} ms  "
+                    f"expected {expected}, used {', '.join(sorted(used)) or 'no index'}"
+                )
+
+        if failures:
+            raise CommandError(f"Queries not using their index: {', '.join(failures)}")
@@ -0,0 +1,70 @@
+import time
+import tracemalloc
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+
+from campaigns.delivery import FROM_EMAIL, build_message
+from mailtemplates.models import EmailTemplate
+from mailtemplates.rendering import render
+
+SAMPLE_BODY = (
+    "<p>Hola {{ first_name }},</p>"
+    "<p>El equipo de {{ department }} ha compartido un documento contigo.</p>"
+    + "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ñandú acción.</p>" * 40
+    + '<p><a href="{{ tracking_url }}">Abrir el documento</a></p>'
+)
+
+
+class Command(BaseCommand):
+    help = "Compares CPU time and memory per message for full MIME builds versus prebuilt skeletons."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help="Messages to build per approach.")
+
+    def handle(self, *args, **options):
+        # Unsaved template with a fake pk so it can use the render caches
+        template = EmailTemplate(pk=-1, version=1, subject="Documento compartido", body=SAMPLE_BODY)
+
+        def context(i):
+            return {
+                'first_name': f"Usuario{i}",
+                'email': f"user{i}@example.test",
+                'department': "Finanzas",
+                'tracking_url': f"https://example.test/campaigns/tutorial/{i}/",
+            }
+
+        def full_build(i):
+            ctx = context(i)
+            subject, body = render(template, ctx)
+            message = EmailMessage(subject, body, FROM_EMAIL, [ctx['email']])
+            message.content_subtype = 'html'
+            return message.message().as_bytes(linesep='\r\n')
+
+        def skeleton_build(i):
+            ctx = context(i)
+            return build_message(template, ctx['email'], context=ctx).message().as_bytes(linesep='\r\n')
+
+        count = options['messages']
+        for label, build in (("full MIME", full_build), ("skeleton", skeleton_build)):
+            build(0)  # Warm caches
+            started = time.process_time()
+            size = 0
+            for i in range(count):
+                size += len(build(i))
+            cpu = (time.process_time() - started) / count
+
+            tracemalloc.start()
+            peak = 0
+            for i in range(min(count, 1000)):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                build(i)
+                peak += tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+            peak /= min(count, 1000)
+
+            self.stdout.write(
+                f"{label:>10}: {cpu * 1e6:8.1f} us CPU/message, "
+                f"{peak / 1024:7.1f} KiB peak allocation/message, {size / count:.0f} bytes/message"
+            )
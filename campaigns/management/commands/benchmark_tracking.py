@@ -0,0 +1,72 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from campaigns.tokens import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the tracking endpoints through the full middleware stack, in process, "
+        "served by the WSGI handler from threads and/or by the ASGI handler from concurrent tasks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help="Total requests to issue per mode.")
+        parser.add_argument('--threads', type=int, default=1, help="Concurrent client threads in sync mode.")
+        parser.add_argument('--concurrency', type=int, default=100, help="Concurrent requests in async mode.")
+        parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+        parser.add_argument('--endpoint', choices=('pixel', 'tutorial'), default='pixel',
+                            help="'tutorial' loads the landing page and needs --user to be a recipient of --campaign.")
+        parser.add_argument('--campaign', type=int, default=1, help="Campaign id encoded in the tracking token.")
+        parser.add_argument('--user', type=int, default=1, help="User id encoded in the tracking token.")
+
+    # The test clients send Host: testserver
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        token = make_token(options['campaign'], options['user'])
+        if options['endpoint'] == 'pixel':
+            url = reverse('campaigns:open_pixel', args=[token])
+        else:
+            url = reverse('campaigns:tracked_tutorial', args=[token])
+        total = options['requests']
+
+        if options['mode'] in ('sync', 'both'):
+            threads = options['threads']
+
+            def hit(count):
+                client = Client()
+                for _ in range(count):
+                    response = client.get(url)
+                    assert response.status_code == 200, response.status_code
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(hit, [total // threads] * threads))
+            self.report(f"sync x{threads}", total // threads * threads, time.perf_counter() - started)
+
+        if options['mode'] in ('async', 'both'):
+            concurrency = options['concurrency']
+
+            async def worker(count):
+                client = AsyncClient()
+                for _ in range(count):
+                    response = await client.get(url)
+                    assert response.status_code == 200, response.status_code
+
+            async def run():
+                await asyncio.gather(*[worker(total // concurrency) for _ in range(concurrency)])
+
+            started = time.perf_counter()
+            asyncio.run(run())
+            self.report(f"async x{concurrency}", total // concurrency * concurrency, time.perf_counter() - started)
+
+    def report(self, label, served, elapsed):
+        self.stdout.write(
+            f"{label:>12}: {served} requests in {elapsed:.2f}s "
+            f"({served / elapsed:.0f} req/s, {elapsed / served * 1e6:.0f} us/request)"
+        )
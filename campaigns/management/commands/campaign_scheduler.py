@@ -0,0 +1,42 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from campaigns.models import Campaign
+from campaigns.scheduler import schedule_campaign, tick
+
+logger = logging.getLogger('campaigns.scheduler')
+
+
+class Command(BaseCommand):
+    help = "Queues due campaign waves for the dispatch workers, spreading sends across each campaign's window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds between ticks.")
+        parser.add_argument('--reschedule', action='store_true', help="Rebuild pending waves for all campaigns before starting.")
+
+    def handle(self, *args, **options):
+        if options['reschedule']:
+            for campaign in Campaign.objects.iterator():
+                schedule_campaign(campaign)
+            self.stdout.write("Pending waves rebuilt")
+        try:
+            while True:
+                # Drops a connection the database closed while we slept
+                close_old_connections()
+                try:
+                    queued = tick()
+                except DatabaseError:
+                    # Keep scheduling; the waves are still pending for the next tick
+                    logger.exception("Scheduler tick failed")
+                    queued = 0
+                if queued:
+                    self.stdout.write(f"Queued {queued} wave(s)")
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
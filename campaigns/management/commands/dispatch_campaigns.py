@@ -0,0 +1,40 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from campaigns.dispatch import claim_job, run_job, worker_name
+
+logger = logging.getLogger('campaigns.dispatch')
+
+
+class Command(BaseCommand):
+    help = "Runs a worker that sends queued campaign dispatch jobs. Several workers can run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process queued jobs and exit when the queue is empty.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait between polls when the queue is empty.")
+
+    def handle(self, *args, **options):
+        name = worker_name()
+        self.stdout.write(f"Dispatch worker {name} started")
+        try:
+            while True:
+                # Drops a connection the database closed while we were idle
+                close_old_connections()
+                try:
+                    job = claim_job(name)
+                    if job is not None:
+                        self.stdout.write(f"Sending campaign '{job.campaign.title}' (job {job.pk})")
+                        run_job(job)
+                        continue
+                except DatabaseError:
+                    # A job cut short is reclaimed once its heartbeat goes stale
+                    logger.exception("Dispatch worker %s hit a database error", name)
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Dispatch worker {name} stopped")
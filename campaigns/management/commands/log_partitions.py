@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from campaigns import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates upcoming monthly PhishingTestLog partitions and archives partitions "
+        "older than the retention window to gzipped CSV files. Meant to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=partitions.PARTITIONS_AHEAD,
+                            help="Months of partitions to keep created ahead of the current one.")
+        parser.add_argument('--retain', type=int, default=partitions.RETENTION_MONTHS,
+                            help="Months of events to keep in the database.")
+        parser.add_argument('--archive-dir', default=partitions.ARCHIVE_DIR,
+                            help="Directory the archived partitions are written to.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived.")
+
+    def handle(self, *args, **options):
+        for name in partitions.ensure_partitions(ahead=options['ahead']):
+            self.stdout.write(f"Created partition {name}")
+
+        expired = partitions.expired_partitions(retention_months=options['retain'])
+        if options['dry_run']:
+            for name in expired:
+                self.stdout.write(f"Would archive {name}")
+            return
+        for name in expired:
+            partitions.detach_partition(name)
+        # Also picks up partitions detached by a run that failed while archiving
+        for name in partitions.detached_partitions():
+            path, rows = partitions.archive_partition(name, options['archive_dir'])
+            self.stdout.write(f"Archived {rows} row(s) from {name} to {path}")
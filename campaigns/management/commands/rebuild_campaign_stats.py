@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from campaigns.stats import rebuild_rollup, rollup_differences
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks the CampaignStat rollup against the retained PhishingTestLog partitions, "
+        "then rebuilds it along with the template and recipient rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report mismatched buckets, don't rebuild.")
+
+    def handle(self, *args, **options):
+        differences = rollup_differences()
+        for campaign_id, action, day, stored, expected in differences:
+            self.stdout.write(
+                f"campaign {campaign_id} {action} {day}: "
+                f"users/hits {stored[0]}/{stored[1]}, log has {expected[0]}/{expected[1]}"
+            )
+        self.stdout.write(f"{len(differences)} mismatched bucket(s)")
+        if options['check']:
+            return
+        rows = rebuild_rollup()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s)"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0003_dispatchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignWave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Wave')),
+                ('due_at', models.DateTimeField(verbose_name='Due At')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('skipped', 'Skipped')], default='pending', max_length=20, verbose_name='Status')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waves', to='campaigns.campaign')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['due_at'], name='campaigns_wave_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'number'), name='campaigns_wave_unique_number')],
+            },
+        ),
+        migrations.AddField(
+            model_name='dispatchjob',
+            name='send_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispatchjob',
+            name='wave',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='campaigns.campaignwave'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0005_campaignrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispatchjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='dispatchjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('campaign',), name='campaigns_dispatch_one_active'),
+        ),
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wave', models.PositiveIntegerField(default=1, verbose_name='Wave')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('bounced', 'Bounced')], default='pending', max_length=20, verbose_name='State')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_messages', to='campaigns.campaign')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='campaigns.campaignrecipient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['campaign', 'wave', 'state'], name='campaigns_outbound_state_idx')],
+                'constraints': [models.UniqueConstraint(fields=('recipient', 'wave'), name='campaigns_outbound_unique_wave')],
+            },
+        ),
+    ]
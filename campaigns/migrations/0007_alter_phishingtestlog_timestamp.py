@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0006_outboundmessage_dispatchjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='phishingtestlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0007_alter_phishingtestlog_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='phishingtestlog',
+            name='action',
+            field=models.CharField(choices=[('reported', 'Reported'), ('clicked', 'Clicked'), ('opened', 'Opened')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Folds repeated (user, campaign, action) rows into the oldest one before the
+# unique constraint is added, keeping first/last timestamps and the hit count.
+COLLAPSE_DUPLICATES = """
+    UPDATE campaigns_phishingtestlog AS log
+       SET timestamp = dup.first_seen, last_seen = dup.last_seen, hits = dup.hits
+      FROM (SELECT min(id) AS id, min(timestamp) AS first_seen, max(timestamp) AS last_seen, count(*) AS hits
+              FROM campaigns_phishingtestlog
+             GROUP BY user_id, campaign_id, action
+            HAVING count(*) > 1) AS dup
+     WHERE log.id = dup.id;
+    DELETE FROM campaigns_phishingtestlog AS log
+     USING campaigns_phishingtestlog AS keep
+     WHERE keep.user_id = log.user_id AND keep.campaign_id = log.campaign_id
+       AND keep.action = log.action AND keep.id < log.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0008_alter_phishingtestlog_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phishingtestlog',
+            name='hits',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='phishingtestlog',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            "UPDATE campaigns_phishingtestlog SET last_seen = timestamp;",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(COLLAPSE_DUPLICATES, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='phishingtestlog',
+            constraint=models.UniqueConstraint(fields=('user', 'campaign', 'action'), name='campaigns_log_unique_action'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+# Rebuilds the log table as a monthly RANGE partitioned table on timestamp.
+# The primary key must include the partition key, hence (id, timestamp); the
+# (user, campaign, action) uniqueness moves to the application (events.upsert).
+PARTITION_TABLE = """
+    ALTER TABLE campaigns_phishingtestlog RENAME TO campaigns_phishingtestlog_old;
+
+    CREATE TABLE campaigns_phishingtestlog (
+        id bigint GENERATED BY DEFAULT AS IDENTITY,
+        action varchar(20) NOT NULL,
+        timestamp timestamp with time zone NOT NULL,
+        last_seen timestamp with time zone NOT NULL,
+        hits integer NOT NULL CHECK (hits >= 0),
+        campaign_id bigint NOT NULL
+            REFERENCES campaigns_campaign (id) DEFERRABLE INITIALLY DEFERRED,
+        user_id bigint NOT NULL
+            REFERENCES accounts_customuser (id) DEFERRABLE INITIALLY DEFERRED,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+
+    CREATE INDEX campaigns_log_action_idx ON campaigns_phishingtestlog (campaign_id, user_id, action);
+    CREATE INDEX campaigns_phishingtestlog_user_id_idx ON campaigns_phishingtestlog (user_id);
+    CREATE TABLE campaigns_phishingtestlog_default PARTITION OF campaigns_phishingtestlog DEFAULT;
+
+    -- One partition per month from the oldest existing row through three months ahead;
+    -- later months are created by the log_partitions command.
+    DO $$
+    DECLARE
+        month date := date_trunc('month', LEAST(
+            (SELECT min(timestamp) FROM campaigns_phishingtestlog_old), now()))::date;
+    BEGIN
+        WHILE month <= date_trunc('month', now() + interval '3 months')::date LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF campaigns_phishingtestlog FOR VALUES FROM (%L) TO (%L)',
+                'campaigns_phishingtestlog_p' || to_char(month, 'YYYY_MM'),
+                month, (month + interval '1 month')::date);
+            month := (month + interval '1 month')::date;
+        END LOOP;
+    END $$;
+
+    INSERT INTO campaigns_phishingtestlog (id, action, timestamp, last_seen, hits, campaign_id, user_id)
+    SELECT id, action, timestamp, last_seen, hits, campaign_id, user_id FROM campaigns_phishingtestlog_old;
+    SELECT setval(pg_get_serial_sequence('campaigns_phishingtestlog', 'id'),
+                  COALESCE((SELECT max(id) FROM campaigns_phishingtestlog), 1));
+    DROP TABLE campaigns_phishingtestlog_old;
+"""
+
+UNPARTITION_TABLE = """
+    ALTER TABLE campaigns_phishingtestlog RENAME TO campaigns_phishingtestlog_partitioned;
+
+    CREATE TABLE campaigns_phishingtestlog (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        action varchar(20) NOT NULL,
+        timestamp timestamp with time zone NOT NULL,
+        last_seen timestamp with time zone NOT NULL,
+        hits integer NOT NULL CHECK (hits >= 0),
+        campaign_id bigint NOT NULL
+            REFERENCES campaigns_campaign (id) DEFERRABLE INITIALLY DEFERRED,
+        user_id bigint NOT NULL
+            REFERENCES accounts_customuser (id) DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT campaigns_log_unique_action UNIQUE (user_id, campaign_id, action)
+    );
+    CREATE INDEX campaigns_phishingtestlog_campaign_id_idx ON campaigns_phishingtestlog (campaign_id);
+
+    INSERT INTO campaigns_phishingtestlog (id, action, timestamp, last_seen, hits, campaign_id, user_id)
+    SELECT id, action, timestamp, last_seen, hits, campaign_id, user_id FROM campaigns_phishingtestlog_partitioned;
+    SELECT setval(pg_get_serial_sequence('campaigns_phishingtestlog', 'id'),
+                  COALESCE((SELECT max(id) FROM campaigns_phishingtestlog), 1));
+    DROP TABLE campaigns_phishingtestlog_partitioned CASCADE;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('campaigns', '0009_phishingtestlog_dedup'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_TABLE, UNPARTITION_TABLE),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='phishingtestlog',
+                    name='campaigns_log_unique_action',
+                ),
+                migrations.AddIndex(
+                    model_name='phishingtestlog',
+                    index=models.Index(fields=['campaign', 'user', 'action'], name='campaigns_log_action_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0010_partition_phishingtestlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('reported', 'Reported'), ('clicked', 'Clicked'), ('opened', 'Opened')], max_length=20)),
+                ('day', models.DateField()),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='campaigns.campaign')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'action', 'day'), name='campaigns_stat_unique_day')],
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO campaigns_campaignstat (campaign_id, action, day, users, hits)
+            SELECT campaign_id, action, timestamp::date, count(*), sum(hits)
+              FROM campaigns_phishingtestlog
+             GROUP BY campaign_id, action, timestamp::date;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+TABLE = 'campaigns_phishingtestlog'
+INDEX = 'campaigns_log_keyset_idx'
+COLUMNS = 'timestamp, id'
+
+
+def create_keyset_index(apps, schema_editor):
+    # A plain CREATE INDEX on the partitioned table would lock every partition
+    # against writes while it builds, and Postgres can't build one concurrently.
+    # So the parent gets an (invalid) index ON ONLY itself, then each partition's
+    # index is built concurrently and attached; the parent's becomes valid once
+    # every partition has one.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY {TABLE} ({COLUMNS})')
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE pg_inherits.inhparent = %s::regclass
+             ORDER BY child.relname
+            """,
+            [TABLE],
+        )
+        partitions = [name for (name,) in cursor.fetchall()]
+        for partition in partitions:
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_keyset_idx ON {partition} ({COLUMNS})')
+            cursor.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {partition}_keyset_idx')
+
+
+def drop_keyset_index(apps, schema_editor):
+    # Drops the partitions' indexes with it
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('campaigns', '0011_campaignstat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_keyset_index, drop_keyset_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='phishingtestlog',
+                    index=models.Index(fields=['timestamp', 'id'], name='campaigns_log_keyset_idx'),
+                ),
+            ],
+        ),
+    ]
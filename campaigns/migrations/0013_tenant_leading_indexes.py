@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+TABLE = 'campaigns_phishingtestlog'
+INDEX = 'campaigns_log_timeline_idx'
+COLUMNS = 'campaign_id, action, timestamp, id'
+
+
+def create_timeline_index(apps, schema_editor):
+    # CREATE INDEX CONCURRENTLY isn't supported on a partitioned table. Instead
+    # create the parent index ON ONLY the parent (invalid until complete), build
+    # each partition's index concurrently and attach it; Postgres marks the
+    # parent valid once every partition has one. New partitions get it on ATTACH.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY {TABLE} ({COLUMNS})')
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE pg_inherits.inhparent = %s::regclass
+             ORDER BY child.relname
+            """,
+            [TABLE],
+        )
+        partitions = [name for (name,) in cursor.fetchall()]
+        for partition in partitions:
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_timeline_idx ON {partition} ({COLUMNS})')
+            cursor.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {partition}_timeline_idx')
+
+
+def drop_timeline_index(apps, schema_editor):
+    # Drops the partitions' indexes with it
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('campaigns', '0012_phishingtestlog_keyset_idx'),
+        ('tenants', '0002_alter_client_contact_email_alter_client_contact_name_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='campaign',
+            index=models.Index(fields=['client', 'start_date'], name='campaigns_client_start_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_timeline_index, drop_timeline_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='phishingtestlog',
+                    index=models.Index(fields=['campaign', 'action', 'timestamp', 'id'], name='campaigns_log_timeline_idx'),
+                ),
+            ],
+        ),
+    ]
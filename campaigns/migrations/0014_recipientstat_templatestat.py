@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0013_tenant_leading_indexes'),
+        ('mailtemplates', '0007_emailtemplate_client_name_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipientStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], max_length=20)),
+                ('recipients', models.IntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipient_stats', to='campaigns.campaign')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='mailtemplates.emailtemplate')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'template', 'state'), name='campaigns_recipientstat_unique', nulls_distinct=False)],
+            },
+        ),
+        migrations.CreateModel(
+            name='TemplateStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('reported', 'Reported'), ('clicked', 'Clicked'), ('opened', 'Opened')], max_length=20)),
+                ('day', models.DateField()),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='template_stats', to='campaigns.campaign')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='mailtemplates.emailtemplate')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'template', 'action', 'day'), name='campaigns_templatestat_unique_day', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO campaigns_recipientstat (campaign_id, template_id, state, recipients)
+            SELECT campaign_id, template_id, state, count(*)
+              FROM campaigns_campaignrecipient
+             GROUP BY campaign_id, template_id, state;
+
+            INSERT INTO campaigns_templatestat (campaign_id, template_id, action, day, users)
+            SELECT log.campaign_id, recipient.template_id, log.action, log.timestamp::date, count(*)
+              FROM campaigns_phishingtestlog AS log
+              JOIN campaigns_campaignrecipient AS recipient
+                ON recipient.campaign_id = log.campaign_id AND recipient.user_id = log.user_id
+             GROUP BY log.campaign_id, recipient.template_id, log.action, log.timestamp::date;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,146 @@
+"""
+Prebuilt MIME skeletons for bulk campaign sends.
+
+For each template version the shared headers and the literal parts of the HTML
+body are encoded once. Per recipient only To, Date, Message-ID, the subject (if
+it has merge fields) and the merge field values are encoded and spliced in.
+
+Body parts are quoted-printable encoded separately and joined with soft line
+breaks ("=" at end of line), which decode to nothing, so the concatenation is a
+valid QP body whose decoded form is the rendered HTML.
+"""
+from email import quoprimime
+from email.header import Header
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import BadHeaderError, EmailMessage
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+from django.utils.html import conditional_escape
+
+from mailtemplates.rendering import LRUCache, get_compiled
+
+CRLF = b'\r\n'
+SOFT_BREAK = b'=\r\n'
+
+_skeletons = LRUCache(getattr(settings, 'EMAIL_TEMPLATE_CACHE_SIZE', 256))
+
+
+def _qp(text):
+    # Same transform email.charset applies for utf-8 quoted-printable bodies; one
+    # column is kept free for the soft break that joins parts together.
+    encoded = quoprimime.body_encode(text.encode('utf-8').decode('latin-1'), maxlinelen=75, eol='\r\n')
+    return encoded.encode('ascii')
+
+
+def _header(name, value):
+    if '\n' in value or '\r' in value:
+        raise BadHeaderError(f"Header values can't contain newlines (got {value!r} for header {name!r})")
+    try:
+        value.encode('ascii')
+    except UnicodeEncodeError:
+        value = Header(value, 'utf-8', header_name=name).encode(linesep='\r\n')
+    return f"{name}: {value}".encode('ascii') + CRLF
+
+
+class RawMessage:
+    """Stands in for the email.message.Message that mail backends serialize."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        return self.data
+
+    def as_string(self, unixfrom=False, linesep='\n'):
+        return self.data.decode('ascii')
+
+    def get_charset(self):
+        return None
+
+
+class PrebuiltEmailMessage(EmailMessage):
+    """An EmailMessage whose serialized form was assembled from a skeleton."""
+
+    def __init__(self, data, **kwargs):
+        super().__init__(**kwargs)
+        self.data = data
+
+    def message(self):
+        return RawMessage(self.data)
+
+
+class MessageSkeleton:
+    """The encoded, recipient-independent parts of one template version."""
+
+    def __init__(self, template, from_email):
+        compiled = get_compiled(template)
+        self.from_email = from_email
+        self.subject = compiled.subject
+        # Subjects without merge fields are encoded once here
+        self.subject_header = None if self.subject.fields else _header('Subject', self.subject.render({}))
+        self.headers = b''.join([
+            _header('From', sanitize_address(from_email, 'utf-8')),
+            b'MIME-Version: 1.0\r\n',
+            b'Content-Type: text/html; charset="utf-8"\r\n',
+            b'Content-Transfer-Encoding: quoted-printable\r\n',
+        ])
+        # Literals at even positions are encoded now; fields stay as names
+        self.body_parts = tuple(
+            _qp(part) if i % 2 == 0 else part
+            for i, part in enumerate(compiled.body.parts)
+        )
+        # Variant with the open-tracking pixel appended, used when the recipient
+        # has an open_url and the template doesn't place one itself
+        self.pixel_body_parts = None
+        if 'open_url' not in compiled.body.fields:
+            self.pixel_body_parts = self.body_parts[:-1] + (
+                SOFT_BREAK.join(filter(None, [self.body_parts[-1], _qp('<img src="')])),
+                'open_url',
+                _qp('" width="1" height="1" alt="" />'),
+            )
+
+    def render(self, recipient_email, context):
+        """Returns the full message bytes for one recipient."""
+        chunks = [
+            self.headers,
+            self.subject_header or _header('Subject', self.subject.render(context, escape=False)),
+            _header('To', sanitize_address(recipient_email, 'utf-8')),
+            _header('Date', formatdate(localtime=settings.EMAIL_USE_LOCALTIME)),
+            _header('Message-ID', make_msgid(domain=DNS_NAME)),
+            CRLF,
+        ]
+        parts = self.body_parts
+        if self.pixel_body_parts and context.get('open_url'):
+            parts = self.pixel_body_parts
+        body = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                part = _qp(conditional_escape(context.get(part) or ''))
+            if part:
+                body.append(part)
+        chunks.append(SOFT_BREAK.join(body))
+        return b''.join(chunks)
+
+    def message(self, recipient_email, context):
+        return PrebuiltEmailMessage(
+            self.render(recipient_email, context),
+            from_email=self.from_email,
+            to=[recipient_email],
+        )
+
+
+def get_skeleton(template, from_email):
+    """
+    Returns the cached skeleton for this template version and sender. Saving
+    a template bumps its version, so stale skeletons are never reused and
+    simply age out of the LRU.
+    """
+    key = (template.pk, template.version, from_email)
+    skeleton = _skeletons.get(key)
+    if skeleton is None:
+        skeleton = MessageSkeleton(template, from_email)
+        _skeletons.set(key, skeleton)
+    return skeleton
+
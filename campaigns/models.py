@@ -3,6 +3,7 @@ from django.db import models
 from django.conf import settings  # For referencing your CustomUser model
 from django.contrib.auth.models import Group
 from tenants.models import Client
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -23,19 +24,254 @@ class Campaign(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Per-tenant campaign lists, newest first (CampaignAdmin, scheduler)
+            models.Index(fields=['client', 'start_date'], name='campaigns_client_start_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 ACTION_CHOICES = (
     ('reported', 'Reported'),
     ('clicked', 'Clicked'),
+    ('opened', 'Opened'),
 )
 
 class PhishingTestLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # First time the user did this, not when it was flushed
+    last_seen = models.DateTimeField(default=timezone.now)
+    hits = models.PositiveIntegerField(default=1)  # Repeated clicks/reports are counted here, not as new rows
+
+    class Meta:
+        # The table is range-partitioned by month on timestamp (migration 0010,
+        # campaigns.partitions). Postgres only allows unique constraints that
+        # include the partition key, so one row per (user, campaign, action) is
+        # enforced by campaigns.events.upsert instead.
+        indexes = [
+            models.Index(fields=['campaign', 'user', 'action'], name='campaigns_log_action_idx'),
+            # Keyset pagination of the admin changelist (core.pagination)
+            models.Index(fields=['timestamp', 'id'], name='campaigns_log_keyset_idx'),
+            # The same, filtered to one campaign and action
+            models.Index(fields=['campaign', 'action', 'timestamp', 'id'], name='campaigns_log_timeline_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.campaign.title} - {self.action}"
+
+
+class CampaignStat(models.Model):
+    """
+    Daily PhishingTestLog totals per campaign and action, kept up to date by
+    campaigns.events as events are written so reports never scan the log.
+    Rows are bucketed by the day a user was first seen doing the action.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='stats')
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    day = models.DateField()
+    users = models.PositiveIntegerField(default=0)  # Distinct users first seen that day
+    hits = models.PositiveIntegerField(default=0)  # All hits by those users, including repeats
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'action', 'day'], name='campaigns_stat_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.action} - {self.day}"
+
+
+class TemplateStat(models.Model):
+    """
+    CampaignStat's new users split by the template each user was sent, for the
+    dashboard's A/B results. Written in the same statement as CampaignStat.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='template_stats')
+    template = models.ForeignKey('mailtemplates.EmailTemplate', on_delete=models.SET_NULL, null=True, blank=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    day = models.DateField()
+    users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL (a deleted template) is one key, so ON CONFLICT merges into it
+            models.UniqueConstraint(
+                fields=['campaign', 'template', 'action', 'day'], nulls_distinct=False,
+                name='campaigns_templatestat_unique_day',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.template_id} - {self.action} - {self.day}"
+
+
+RECIPIENT_STATE_CHOICES = (
+    ('pending', _('Pending')),
+    ('sent', _('Sent')),
+    ('failed', _('Failed')),
+)
+
+class CampaignRecipient(models.Model):
+    """
+    Snapshot of a campaign's audience, taken when it is first launched.
+    Sends, retries and stats read this table instead of re-joining group membership.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='recipients')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    template = models.ForeignKey('mailtemplates.EmailTemplate', on_delete=models.SET_NULL, null=True, blank=True)
+    token = models.CharField(max_length=32, unique=True)  # Resolves open pixels from emails sent before links carried signed tokens
+    state = models.CharField(max_length=20, choices=RECIPIENT_STATE_CHOICES, default='pending', verbose_name=_("State"))
+    sent_count = models.PositiveIntegerField(default=0, verbose_name=_("Emails Sent"))
+    last_sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'user'], name='campaigns_recipient_unique_user'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'state'], name='campaigns_recipient_state_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.user_id} - {self.state}"
+
+
+class RecipientStat(models.Model):
+    """
+    CampaignRecipient counts per campaign, template and state, kept up to date
+    by campaigns.recipients as the audience is snapshotted and sent.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='recipient_stats')
+    template = models.ForeignKey('mailtemplates.EmailTemplate', on_delete=models.SET_NULL, null=True, blank=True)
+    state = models.CharField(max_length=20, choices=RECIPIENT_STATE_CHOICES)
+    recipients = models.IntegerField(default=0)  # Signed: a state change adds -n to the old state's row
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['campaign', 'template', 'state'], nulls_distinct=False, name='campaigns_recipientstat_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.template_id} - {self.state}"
+
+
+WAVE_STATUS_CHOICES = (
+    ('pending', _('Pending')),
+    ('queued', _('Queued')),
+    ('skipped', _('Skipped')),
+)
+
+class CampaignWave(models.Model):
+    """
+    One of the `number_of_emails` sends of a campaign, spread evenly between
+    start_date and end_date. The scheduler turns due waves into DispatchJobs.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='waves')
+    number = models.PositiveIntegerField(verbose_name=_("Wave"))
+    due_at = models.DateTimeField(verbose_name=_("Due At"))
+    status = models.CharField(max_length=20, choices=WAVE_STATUS_CHOICES, default='pending', verbose_name=_("Status"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'number'], name='campaigns_wave_unique_number'),
+        ]
+        indexes = [
+            # Each scheduler tick reads only pending waves ordered by due time
+            models.Index(fields=['due_at'], condition=models.Q(status='pending'), name='campaigns_wave_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.number}/{self.campaign.number_of_emails}"
+
+
+DISPATCH_STATUS_CHOICES = (
+    ('queued', _('Queued')),
+    ('running', _('Running')),
+    ('done', _('Done')),
+    ('failed', _('Failed')),
+)
+
+class DispatchJob(models.Model):
+    """
+    A request to send a campaign, picked up by the `dispatch_campaigns` worker.
+    Counters are updated as batches go out so the dashboard can show progress.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='dispatch_jobs')
+    wave = models.ForeignKey(CampaignWave, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    send_until = models.DateTimeField(null=True, blank=True)  # Sends are paced to finish by this time
+    status = models.CharField(max_length=20, choices=DISPATCH_STATUS_CHOICES, default='queued', verbose_name=_("Status"))
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+
+    queued = models.PositiveIntegerField(default=0, verbose_name=_("Queued"))
+    sent = models.PositiveIntegerField(default=0, verbose_name=_("Sent"))
+    failed = models.PositiveIntegerField(default=0, verbose_name=_("Failed"))
+    error = models.TextField(blank=True, default='')
+
+    worker = models.CharField(max_length=255, blank=True, default='')  # host:pid of the claiming worker
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last progress update from the worker
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One active send per campaign, so repeated clicks can't start parallel sends
+            models.UniqueConstraint(
+                fields=['campaign'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='campaigns_dispatch_one_active',
+            ),
+        ]
+        indexes = [
+            # Workers poll for the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='campaigns_dispatch_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.status}"
+
+    @property
+    def wave_number(self):
+        # Manual sends count as the first wave, so a later scheduled first wave won't resend
+        return self.wave.number if self.wave_id else 1
+
+
+MESSAGE_STATE_CHOICES = (
+    ('pending', _('Pending')),
+    ('sent', _('Sent')),
+    ('failed', _('Failed')),
+    ('bounced', _('Bounced')),
+)
+
+class OutboundMessage(models.Model):
+    """
+    Ledger of every email a campaign wave sends to a recipient.
+    Rows are written as pending before a batch goes out and flipped in bulk
+    afterwards, so an interrupted send can resume without duplicates.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='outbound_messages')
+    recipient = models.ForeignKey(CampaignRecipient, on_delete=models.CASCADE, related_name='messages')
+    wave = models.PositiveIntegerField(default=1, verbose_name=_("Wave"))
+    state = models.CharField(max_length=20, choices=MESSAGE_STATE_CHOICES, default='pending', verbose_name=_("State"))
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'wave'], name='campaigns_outbound_unique_wave'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'wave', 'state'], name='campaigns_outbound_state_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign.title} - {self.recipient_id} - {self.wave} - {self.state}"
@@ -0,0 +1,158 @@
+"""
+Monthly range partitions of the PhishingTestLog table.
+
+Migration 0010 turns campaigns_phishingtestlog into a table partitioned by
+RANGE (timestamp), with one partition per month named
+campaigns_phishingtestlog_pYYYY_MM and a DEFAULT partition catching anything
+outside them. The `log_partitions` command keeps partitions created ahead of
+time and applies the retention policy: partitions older than
+CAMPAIGN_LOG_RETENTION_MONTHS are detached, written to a gzipped CSV under
+CAMPAIGN_LOG_ARCHIVE_DIR and dropped.
+"""
+import csv
+import gzip
+import os
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import PhishingTestLog
+
+PARTITIONS_AHEAD = getattr(settings, 'CAMPAIGN_LOG_PARTITIONS_AHEAD', 3)
+RETENTION_MONTHS = getattr(settings, 'CAMPAIGN_LOG_RETENTION_MONTHS', 13)
+ARCHIVE_DIR = getattr(settings, 'CAMPAIGN_LOG_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+TABLE = PhishingTestLog._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+_NAME_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def partition_month(name):
+    """The first day of the month stored in partition `name`, or None for other tables."""
+    match = _NAME_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def attached_partitions():
+    """Monthly partitions currently attached to the log table, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE parent.relname = %s
+            """,
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall() if partition_month(name)]
+    return sorted(names)
+
+
+def retained_since():
+    """
+    The first day still held by a monthly partition, or None if there are none.
+    Days before it were archived: their rollup rows are all that is left.
+    """
+    names = attached_partitions()
+    return partition_month(names[0]) if names else None
+
+
+def detached_partitions():
+    """Monthly partitions detached by an earlier run whose archive was not finished."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname FROM pg_class
+             WHERE relkind = 'r' AND relname LIKE %s AND NOT relispartition
+            """,
+            [f'{TABLE}\\_p%'],
+        )
+        names = [name for (name,) in cursor.fetchall() if partition_month(name)]
+    return sorted(names)
+
+
+def create_partition(month):
+    """
+    Creates the partition for `month` unless it exists. Rows that already landed
+    in the DEFAULT partition for that month are moved into it, since Postgres
+    refuses to attach a range the default partition still holds rows for.
+    """
+    name = partition_name(month)
+    if name in attached_partitions():
+        return False
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')"
+        )
+    return True
+
+
+def ensure_partitions(today=None, ahead=PARTITIONS_AHEAD):
+    """Makes sure partitions exist from the current month through `ahead` months later."""
+    current = (today or date.today()).replace(day=1)
+    return [
+        partition_name(month)
+        for month in (add_months(current, i) for i in range(ahead + 1))
+        if create_partition(month)
+    ]
+
+
+def expired_partitions(today=None, retention_months=RETENTION_MONTHS):
+    """Attached partitions whose whole month is older than the retention window."""
+    cutoff = add_months((today or date.today()).replace(day=1), -retention_months)
+    return [name for name in attached_partitions() if partition_month(name) < cutoff]
+
+
+def detach_partition(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+
+
+def archive_partition(name, directory=ARCHIVE_DIR):
+    """
+    Writes a detached partition to `<directory>/<name>.csv.gz` and drops it.
+    Rows are streamed with a server-side cursor, so memory use doesn't depend on
+    the partition size. Returns (path, rows).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.csv.gz')
+    columns = [field.column for field in PhishingTestLog._meta.concrete_fields]
+    rows = 0
+    with transaction.atomic():
+        with gzip.open(path + '.tmp', 'wt', newline='') as archive:
+            writer = csv.writer(archive)
+            writer.writerow(columns)
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {name} ORDER BY id")
+                for row in cursor:
+                    writer.writerow(row)
+                    rows += 1
+        # Only drop the table once the archive is complete on disk
+        os.replace(path + '.tmp', path)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {name}')
+    return path, rows
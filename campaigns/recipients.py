@@ -0,0 +1,134 @@
+"""
+Recipient resolution for campaigns.
+
+At launch the audience is snapshotted into CampaignRecipient with a single
+set-based INSERT ... SELECT. Recipients are read in keyset-paginated chunks ordered by user id, so memory
+stays bounded whatever the size of the campaign's groups. Group membership is
+tested with an EXISTS semi-join, which yields each user once without the
+global DISTINCT sort a plain join over the groups would need.
+
+Snapshots and state changes also keep the RecipientStat counts the dashboard
+reads, so they should go through snapshot_recipients and set_state.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef
+
+from accounts.models import CustomUser
+from .models import CampaignRecipient, RecipientStat
+
+CHUNK_SIZE = getattr(settings, 'CAMPAIGN_RECIPIENT_CHUNK_SIZE', 2000)
+
+
+def recipients_queryset(campaign):
+    """Users belonging to any of the campaign's groups, one row per user."""
+    Membership = CustomUser.groups.through
+    campaign_groups = campaign.groups.through.objects.filter(campaign_id=campaign.pk).values('group_id')
+    in_groups = Exists(
+        Membership.objects.filter(customuser_id=OuterRef('pk'), group_id__in=campaign_groups)
+    )
+    return CustomUser.objects.filter(in_groups)
+
+
+def iter_keyset(queryset, fields, chunk_size=None):
+    """
+    Yields value tuples of `fields` from `queryset`, `chunk_size` rows at a time,
+    paging on the primary key (which must be the first field) instead of OFFSET.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    queryset = queryset.order_by('pk').values_list(*fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1][0]
+
+
+def snapshot_recipients(campaign):
+    """
+    Inserts a CampaignRecipient row for every member of the campaign's groups,
+    with a template and a random token per recipient, and counts them in
+    RecipientStat, in one statement.
+    Users already in the snapshot, and users without an email address, are
+    left out. Returns the rows added.
+
+    Templates are assigned round-robin over the whole audience, ordered by
+    department and then by a hash of (campaign, user): template counts differ
+    by at most one, overall and within each department, and the same audience
+    always gets the same assignment.
+    """
+    template_ids = list(campaign.templates.order_by('pk').values_list('pk', flat=True))
+    if not template_ids:
+        return 0
+    # Users without an address can't be sent anything
+    members = recipients_queryset(campaign).exclude(email='').values('pk', 'department')
+    members_sql, members_params = members.query.sql_with_params()
+    sql = f"""
+        WITH added AS (
+            INSERT INTO {CampaignRecipient._meta.db_table}
+                (campaign_id, user_id, template_id, token, state, sent_count, created_at)
+            SELECT %s,
+                   members.id,
+                   (%s::bigint[])[1 + ((row_number() OVER (
+                       ORDER BY members.department, md5(%s::text || ':' || members.id::text), members.id
+                   ) - 1) %% %s)::int],
+                   md5(random()::text || clock_timestamp()::text || members.id::text),
+                   'pending',
+                   0,
+                   now()
+            FROM ({members_sql}) AS members
+            ON CONFLICT (campaign_id, user_id) DO NOTHING
+            RETURNING campaign_id, template_id
+        ),
+        counted AS (
+            INSERT INTO {RecipientStat._meta.db_table} AS stat (campaign_id, template_id, state, recipients)
+            SELECT campaign_id, template_id, 'pending', count(*) FROM added GROUP BY campaign_id, template_id
+            ON CONFLICT (campaign_id, template_id, state) DO UPDATE
+               SET recipients = stat.recipients + EXCLUDED.recipients
+        )
+        SELECT count(*) FROM added
+    """
+    params = [campaign.pk, template_ids, campaign.pk, len(template_ids), *members_params]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+def set_state(recipient_ids, state, **fields):
+    """
+    Sets the recipients `recipient_ids` to `state`, along with any other
+    `fields`, and moves the ones that changed state between RecipientStat rows.
+    """
+    recipients = CampaignRecipient.objects.filter(pk__in=recipient_ids)
+    with transaction.atomic():
+        # Only the campaign's dispatch job changes its recipients, so the old states can't move underneath
+        moved = recipients.exclude(state=state).values_list('campaign_id', 'template_id', 'state').annotate(
+            count=Count('pk'),
+        ).order_by()
+        deltas = Counter()
+        for campaign_id, template_id, old_state, count in moved:
+            deltas[campaign_id, template_id, old_state] -= count
+            deltas[campaign_id, template_id, state] += count
+        recipients.update(state=state, **fields)
+        _add_stats(deltas)
+
+
+def _add_stats(deltas):
+    # Sorted so concurrent writers lock the rows in the same order
+    rows = sorted(deltas.items(), key=str)
+    if not rows:
+        return
+    values = ', '.join(['(%s::bigint, %s::bigint, %s::varchar, %s::integer)'] * len(rows))
+    sql = f"""
+        INSERT INTO {RecipientStat._meta.db_table} AS stat (campaign_id, template_id, state, recipients)
+        VALUES {values}
+        ON CONFLICT (campaign_id, template_id, state) DO UPDATE
+           SET recipients = stat.recipients + EXCLUDED.recipients
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for key, count in rows for value in (*key, count)])
@@ -0,0 +1,87 @@
+"""
+Drip scheduling for campaigns.
+
+Each campaign is split into `number_of_emails` waves spread evenly across its
+start_date/end_date window. The `campaign_scheduler` command calls tick(),
+which turns due waves into paced DispatchJobs with one indexed query.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import CampaignWave, DispatchJob
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long one wave's sends are spread out
+WAVE_SPREAD = timedelta(seconds=getattr(settings, 'CAMPAIGN_WAVE_SPREAD_SECONDS', 3600))
+
+
+def wave_interval(campaign):
+    waves = max(1, campaign.number_of_emails)
+    return (campaign.end_date - campaign.start_date) / waves
+
+
+def schedule_campaign(campaign):
+    """
+    (Re)builds the pending waves of a campaign from its dates and number_of_emails.
+    Waves that were already queued are kept.
+    """
+    interval = wave_interval(campaign)
+    with transaction.atomic():
+        campaign.waves.filter(status='pending').delete()
+        done = set(campaign.waves.values_list('number', flat=True))
+        CampaignWave.objects.bulk_create([
+            CampaignWave(campaign=campaign, number=number, due_at=campaign.start_date + interval * (number - 1))
+            for number in range(1, campaign.number_of_emails + 1)
+            if number not in done
+        ])
+
+
+def tick(now=None):
+    """
+    Queues a DispatchJob for every pending wave that is due.
+    Campaigns that still have an active job keep their waves pending until it
+    finishes (including a manual send queued while this runs), and locked rows
+    are skipped so several schedulers can run safely.
+    Returns the number of waves queued.
+    """
+    now = now or timezone.now()
+    active = DispatchJob.objects.filter(campaign=OuterRef('campaign'), status__in=['queued', 'running'])
+    with transaction.atomic():
+        due = list(
+            CampaignWave.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('campaign')
+            .filter(status='pending', due_at__lte=now)
+            .filter(~Exists(active))
+            .order_by('due_at')
+        )
+        queued = set()
+        changed = []
+        for wave in due:
+            campaign = wave.campaign
+            if campaign.pk in queued:
+                continue  # One job per campaign at a time; the next wave waits for a later tick
+            if now >= campaign.end_date:
+                # The window closed while the scheduler was down; don't burst late mail
+                wave.status = 'skipped'
+                changed.append(wave)
+                logger.warning("Skipping wave %s of campaign %s: window has closed", wave.number, campaign.pk)
+                continue
+            send_until = min(now + min(wave_interval(campaign), WAVE_SPREAD), campaign.end_date)
+            try:
+                with transaction.atomic():
+                    DispatchJob.objects.create(campaign=campaign, wave=wave, send_until=send_until)
+            except IntegrityError:
+                # A manual send was queued since the check above; the wave waits for it
+                logger.info("Campaign %s got an active job meanwhile; wave %s stays pending", campaign.pk, wave.number)
+                continue
+            queued.add(campaign.pk)
+            wave.status = 'queued'
+            changed.append(wave)
+        CampaignWave.objects.bulk_update(changed, ['status'])
+    return len(queued)
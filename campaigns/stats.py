@@ -0,0 +1,158 @@
+"""
+Reporting queries over the rollups, and the tools to check and rebuild them.
+
+CampaignStat and TemplateStat are derived from the log, which only holds the
+months still in a partition (see campaigns.partitions): buckets for archived
+days are left alone. RecipientStat is derived from CampaignRecipient.
+"""
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.lookups import IsNull
+from django.utils import timezone
+
+from .events import UPSERT_LOCK_ID
+from .models import CampaignRecipient, CampaignStat, PhishingTestLog, RecipientStat, TemplateStat
+from .partitions import retained_since
+
+
+def template_stats():
+    """
+    Recipients, clicks and reports per campaign and assigned template, in one
+    grouped query over the rollups. Each recipient counts at most once per
+    action, so clicked / recipients is the template's click rate. Recipients
+    of deleted templates are reported under no template.
+    """
+    def acted(action):
+        same_template = Q(template=OuterRef('template')) | Q(template__isnull=True, _outer_null=True)
+        users = (
+            TemplateStat.objects.annotate(_outer_null=IsNull(OuterRef('template'), True))
+            .filter(same_template, campaign=OuterRef('campaign'), action=action)
+            .values('campaign').annotate(total=Sum('users')).values('total')
+        )
+        return Coalesce(Subquery(users), 0)
+
+    return (
+        RecipientStat.objects
+        .values('campaign', 'campaign__title', 'template', 'template__name')
+        .annotate(recipients=Sum('recipients'), clicked=acted('clicked'), reported=acted('reported'))
+        .order_by('campaign__title', 'template__name')
+    )
+
+
+def fold_template_stats(sender, instance, **kwargs):
+    """
+    Signal receiver for EmailTemplate deletion: adds the template's rollup rows
+    to the campaign's no-template rows (what its recipients become) and removes
+    them, before SET_NULL would collide with those rows.
+    """
+    folds = (
+        (RecipientStat._meta.db_table, 'state', 'recipients'),
+        (TemplateStat._meta.db_table, 'action, day', 'users'),
+    )
+    with connection.cursor() as cursor:
+        for table, key, count in folds:
+            cursor.execute(
+                f"""
+                WITH folded AS (
+                    DELETE FROM {table} WHERE template_id = %s RETURNING campaign_id, {key}, {count}
+                )
+                INSERT INTO {table} AS stat (campaign_id, template_id, {key}, {count})
+                SELECT campaign_id, NULL, {key}, {count} FROM folded
+                ON CONFLICT (campaign_id, template_id, {key}) DO UPDATE
+                   SET {count} = stat.{count} + EXCLUDED.{count}
+                """,
+                [instance.pk],
+            )
+
+
+def rollup_differences():
+    """
+    Compares CampaignStat with totals computed from the log and returns
+    [(campaign_id, action, day, (users, hits) stored, (users, hits) expected)]
+    for every bucket that doesn't match. Scans the log's retained partitions.
+    """
+    since = retained_since()
+    log = PhishingTestLog.objects.all()
+    stats = CampaignStat.objects.all()
+    if since:
+        log = log.filter(timestamp__gte=timezone.make_aware(datetime.combine(since, time.min)))
+        stats = stats.filter(day__gte=since)
+    expected = {
+        (row['campaign_id'], row['action'], row['day']): (row['users'], row['hits'])
+        for row in log.annotate(day=TruncDate('timestamp'))
+            .values('campaign_id', 'action', 'day')
+            .annotate(users=Count('pk'), hits=Sum('hits'))
+            .order_by()
+    }
+    stored = {
+        (campaign_id, action, day): (users, hits)
+        for campaign_id, action, day, users, hits in stats.values_list(
+            'campaign_id', 'action', 'day', 'users', 'hits',
+        )
+    }
+    return [
+        (*key, stored.get(key, (0, 0)), expected.get(key, (0, 0)))
+        for key in sorted(stored.keys() | expected.keys(), key=str)
+        if stored.get(key, (0, 0)) != expected.get(key, (0, 0))
+    ]
+
+
+def rebuild_rollup():
+    """
+    Recomputes CampaignStat and TemplateStat from the log for the days it still
+    holds, and RecipientStat from CampaignRecipient. Event flushes and sends
+    wait until it is done. Returns the CampaignStat rows written.
+    """
+    since = retained_since()
+    params = [since] if since else []
+    retained = 'WHERE day >= %s' if since else ''
+    # A date compares with the partition bounds at midnight in the session time zone, like ::date
+    log_retained = 'WHERE log.timestamp >= %s::date' if since else ''
+    log = PhishingTestLog._meta.db_table
+    recipients = CampaignRecipient._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Waits for in-flight flushes, which hold this lock shared, and holds off new ones
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [UPSERT_LOCK_ID])
+        # Blocks snapshots and state changes, which write RecipientStat
+        cursor.execute(f'LOCK TABLE {recipients} IN SHARE MODE')
+
+        cursor.execute(f'DELETE FROM {CampaignStat._meta.db_table} {retained}', params)
+        cursor.execute(
+            f"""
+            INSERT INTO {CampaignStat._meta.db_table} (campaign_id, action, day, users, hits)
+            SELECT campaign_id, action, timestamp::date, count(*), sum(hits)
+              FROM {log} AS log
+             {log_retained}
+             GROUP BY campaign_id, action, timestamp::date
+            """,
+            params,
+        )
+        rows = cursor.rowcount
+
+        cursor.execute(f'DELETE FROM {TemplateStat._meta.db_table} {retained}', params)
+        cursor.execute(
+            f"""
+            INSERT INTO {TemplateStat._meta.db_table} (campaign_id, template_id, action, day, users)
+            SELECT log.campaign_id, recipient.template_id, log.action, log.timestamp::date, count(*)
+              FROM {log} AS log
+              JOIN {recipients} AS recipient
+                ON recipient.campaign_id = log.campaign_id AND recipient.user_id = log.user_id
+             {log_retained}
+             GROUP BY log.campaign_id, recipient.template_id, log.action, log.timestamp::date
+            """,
+            params,
+        )
+
+        cursor.execute(f'DELETE FROM {RecipientStat._meta.db_table}')
+        cursor.execute(
+            f"""
+            INSERT INTO {RecipientStat._meta.db_table} (campaign_id, template_id, state, recipients)
+            SELECT campaign_id, template_id, state, count(*)
+              FROM {recipients}
+             GROUP BY campaign_id, template_id, state
+            """
+        )
+        return rows
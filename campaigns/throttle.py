@@ -0,0 +1,100 @@
+"""
+Thread-safe rate and concurrency limits used by the concurrent campaign sender.
+
+Limits are kept per recipient domain (so target mail servers don't throttle us)
+and per tenant (so one client's campaign can't take the whole relay).
+
+The configured limits are for the whole deployment. Each dispatch worker process
+enforces its share of them in memory, so CAMPAIGN_DISPATCH_WORKERS must match the
+number of `dispatch_campaigns` processes running.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+# Defaults, overridable from settings.py
+DOMAIN_RATE = getattr(settings, 'CAMPAIGN_DOMAIN_RATE', 10)                # messages/second per recipient domain
+DOMAIN_CONNECTIONS = getattr(settings, 'CAMPAIGN_DOMAIN_CONNECTIONS', 2)   # concurrent sends per recipient domain
+TENANT_RATE = getattr(settings, 'CAMPAIGN_TENANT_RATE', 50)                # messages/second per tenant
+TENANT_CONNECTIONS = getattr(settings, 'CAMPAIGN_TENANT_CONNECTIONS', 4)   # open relay connections per tenant
+# Per-domain overrides, e.g. {'gmail.com': {'rate': 5, 'connections': 1}}
+DOMAIN_LIMITS = getattr(settings, 'CAMPAIGN_DOMAIN_LIMITS', {})
+WORKERS = max(1, getattr(settings, 'CAMPAIGN_DISPATCH_WORKERS', 1))         # dispatch processes sharing the limits
+
+
+class RateLimiter:
+    """
+    Token bucket: allows `rate` acquisitions per second with bursts up to `burst`.
+    `clock` and `sleep` default to the real ones; tests pass fakes.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return  # Unlimited
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+def _share(rate, connections):
+    """This process's share of a deployment-wide limit; every worker keeps at least one slot."""
+    return rate / WORKERS, max(1, connections // WORKERS)
+
+
+class Limit:
+    """A rate limiter plus a cap on concurrent holders."""
+
+    def __init__(self, rate, connections):
+        self.rate = RateLimiter(rate)
+        self.connections = connections
+        self.slots = threading.BoundedSemaphore(connections)
+
+    def __enter__(self):
+        self.slots.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.slots.release()
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get(key, factory):
+    with _registry_lock:
+        limit = _registry.get(key)
+        if limit is None:
+            limit = _registry[key] = factory()
+        return limit
+
+
+def domain_limit(domain):
+    """Shared limit for a recipient domain."""
+    overrides = DOMAIN_LIMITS.get(domain, {})
+    return _get(('domain', domain), lambda: Limit(*_share(
+        overrides.get('rate', DOMAIN_RATE),
+        overrides.get('connections', DOMAIN_CONNECTIONS),
+    )))
+
+
+def tenant_limit(client_id):
+    """Shared limit for a tenant (Client)."""
+    return _get(('tenant', client_id), lambda: Limit(*_share(TENANT_RATE, TENANT_CONNECTIONS)))
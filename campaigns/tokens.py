@@ -0,0 +1,44 @@
+"""
+Signed per-recipient tracking tokens.
+
+A token encodes (campaign id, user id) in base62 and is signed with the
+project's SECRET_KEY and a timestamp, so the landing endpoints can attribute a
+click, report or open without a login or a session. Tokens older than
+CAMPAIGN_TOKEN_MAX_AGE seconds are rejected. Example: "1c.9Fz:<time>:<sig>".
+
+A valid signature only proves the ids were issued once; the views still check
+that the user is a recipient of the campaign, which also covers either having
+been deleted since.
+"""
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+BASE_URL = getattr(settings, 'CAMPAIGN_BASE_URL', 'http://localhost:8000')
+MAX_AGE = getattr(settings, 'CAMPAIGN_TOKEN_MAX_AGE', 60 * 60 * 24 * 180)
+
+_signer = signing.TimestampSigner(salt='campaigns.tracking')
+
+
+def make_token(campaign_id, user_id):
+    return _signer.sign(f"{signing.b62_encode(campaign_id)}.{signing.b62_encode(user_id)}")
+
+
+def read_token(token):
+    """Returns (campaign_id, user_id) for a valid, unexpired token, or None."""
+    try:
+        campaign_part, user_part = _signer.unsign(token, max_age=MAX_AGE).split('.')
+        return signing.b62_decode(campaign_part), signing.b62_decode(user_part)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def tracking_links(campaign_id, user_id):
+    """Absolute URLs for the {{ tracking_url }}, {{ report_url }} and {{ open_url }} merge fields."""
+    token = make_token(campaign_id, user_id)
+    base = BASE_URL.rstrip('/')
+    return {
+        'tracking_url': base + reverse('campaigns:tracked_tutorial', args=[token]),
+        'report_url': base + reverse('campaigns:tracked_report', args=[token]),
+        'open_url': base + reverse('campaigns:open_pixel', args=[token]),
+    }
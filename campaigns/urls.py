@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'campaigns'
@@ -6,6 +6,10 @@ app_name = 'campaigns'
 urlpatterns = [
     path('report/<int:campaign_id>/', views.report_phishing, name='report_phishing'),
     path('tutorial/<int:campaign_id>/', views.phishing_tutorial, name='phishing_tutorial'),
+    path('r/<str:token>/', views.tracked_report, name='tracked_report'),
+    path('t/<str:token>/', views.tracked_tutorial, name='tracked_tutorial'),
+    re_path(r'^open/(?P<token>[\w.:-]+)\.gif$', views.open_pixel, name='open_pixel'),
     path('dashboard/', views.report_dashboard, name='dashboard'),
+    path('export/', views.export_results, name='export_results'),
     path('send/<int:campaign_id>/', views.send_campaign_emails, name='send_campaign_emails'),
 ]
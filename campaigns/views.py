@@ -1,72 +1,175 @@
+import base64
+from datetime import timedelta
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
-from .models import Campaign, PhishingTestLog
+from .models import Campaign, CampaignStat, DispatchJob, CampaignRecipient, RecipientStat
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count
-from django.core.mail import send_mail
-from django.shortcuts import render, get_object_or_404, redirect
+from django.db.models import Sum
 from django.contrib import messages
-from accounts.models import CustomUser
+from .dispatch import enqueue
+from .events import arecord_event, arecord_token_event
+from .exports import FORMATS, export_queryset, export_response
+from .recipients import recipients_queryset
+from .stats import template_stats
+from .tokens import read_token
+from core.db_router import reporting
+from tenants.resolver import TTLCache
 
+# Tokens from emails sent before links were signed are resolved when events are flushed
+LEGACY_PIXEL_TOKENS = getattr(settings, 'CAMPAIGN_LEGACY_PIXEL_TOKENS', True)
+# Recipients already seen by the open pixel, so repeated opens skip the lookup
+_known_recipients = TTLCache(
+    getattr(settings, 'CAMPAIGN_RECIPIENT_CACHE_SIZE', 10000),
+    getattr(settings, 'CAMPAIGN_RECIPIENT_CACHE_TTL', 300),
+)
+
+
+async def _landing_campaign(campaign_id):
+    # Only what the landing templates show, fetched without blocking the event loop
+    try:
+        return await Campaign.objects.only('id', 'title').aget(id=campaign_id)
+    except Campaign.DoesNotExist:
+        raise Http404
 
 @login_required
-def report_phishing(request, campaign_id):
+async def report_phishing(request, campaign_id):
     # Record that the user reported the phishing email
-    campaign = get_object_or_404(Campaign, id=campaign_id)
-    PhishingTestLog.objects.create(user=request.user, campaign=campaign, action='reported')
+    campaign = await _landing_campaign(campaign_id)
+    user = await request.auser()
+    await arecord_event(user.pk, campaign.pk, 'reported')
     return render(request, 'campaigns/report_success.html', {'campaign': campaign})
 
 @login_required
-def phishing_tutorial(request, campaign_id):
+async def phishing_tutorial(request, campaign_id):
     # Record that the user clicked on the phishing link
-    campaign = get_object_or_404(Campaign, id=campaign_id)
-    PhishingTestLog.objects.create(user=request.user, campaign=campaign, action='clicked')
+    campaign = await _landing_campaign(campaign_id)
+    user = await request.auser()
+    await arecord_event(user.pk, campaign.pk, 'clicked')
     # Render a simple tutorial page explaining the phishing risks
     return render(request, 'campaigns/tutorial.html', {'campaign': campaign})
 
+async def _is_recipient(campaign_id, user_id):
+    key = (campaign_id, user_id)
+    if _known_recipients.get(key):
+        return True
+    found = await CampaignRecipient.objects.filter(campaign_id=campaign_id, user_id=user_id).aexists()
+    if found:
+        _known_recipients.set(key, True)
+    return found
+
+async def _tracked_landing(request, token, action, template_name):
+    # Links from campaign emails: the signed token identifies the recipient, so there is
+    # no login redirect and no session or user lookup. One query checks that the user is
+    # (still) a recipient of the campaign and fetches the campaign for the page.
+    decoded = read_token(token)
+    if decoded is None:
+        raise Http404
+    campaign_id, user_id = decoded
+    try:
+        recipient = await CampaignRecipient.objects.select_related('campaign').only(
+            'campaign', 'campaign__title',
+        ).aget(campaign_id=campaign_id, user_id=user_id)
+    except CampaignRecipient.DoesNotExist:
+        raise Http404
+    campaign = recipient.campaign
+    await arecord_event(user_id, campaign.pk, action)
+    return render(request, template_name, {'campaign': campaign})
+
+async def tracked_report(request, token):
+    return await _tracked_landing(request, token, 'reported', 'campaigns/report_success.html')
+
+async def tracked_tutorial(request, token):
+    return await _tracked_landing(request, token, 'clicked', 'campaigns/tutorial.html')
+
+# Transparent 1x1 GIF, served from memory for every open
+TRACKING_PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+async def open_pixel(request, token):
+    # Hot path for email clients prefetching images: no template, session or user
+    # access (so those middlewares stay lazy), the recipient check is usually cached
+    # and the event is buffered, not written. The GIF is served either way.
+    decoded = read_token(token)
+    if decoded is not None:
+        campaign_id, user_id = decoded
+        if await _is_recipient(campaign_id, user_id):
+            await arecord_event(user_id, campaign_id, 'opened')
+    elif LEGACY_PIXEL_TOKENS and len(token) == 32:
+        # Random per-recipient token from emails sent before links were signed
+        await arecord_token_event(token, 'opened')
+    response = HttpResponse(TRACKING_PIXEL, content_type='image/gif')
+    response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
+# Window of the dashboard's recent activity table
+RECENT_DAYS = 30
+
 @staff_member_required
+@reporting()  # Aggregates are read from the replica when it's usable
 def report_dashboard(request):
-    # Aggregate logs per campaign and per action type
-    campaign_stats = PhishingTestLog.objects.values('campaign__title', 'action').annotate(count=Count('id'))
-    return render(request, 'campaigns/dashboard.html', {'campaign_stats': campaign_stats})
+    # Per campaign and action totals, read from the daily rollup instead of the log table
+    campaign_stats = CampaignStat.objects.values('campaign__title', 'action').annotate(
+        count=Sum('users'), hits=Sum('hits'),
+    ).order_by('campaign__title', 'action')
+    # Users first seen in the recent window
+    since = timezone.localdate() - timedelta(days=RECENT_DAYS)
+    recent_stats = CampaignStat.objects.filter(day__gte=since).values('campaign__title', 'action').annotate(
+        count=Sum('users'),
+    ).order_by('campaign__title', 'action')
+    # Audience snapshot per campaign and send state, from its rollup
+    recipient_stats = RecipientStat.objects.values('campaign__title', 'state').annotate(
+        count=Sum('recipients'),
+    ).filter(count__gt=0).order_by('campaign__title', 'state')
+    # A/B results: click and report rates per assigned template, from the rollups
+    template_results = template_stats()
+    # Most recent send jobs with their queued/sent/failed counters
+    dispatch_jobs = DispatchJob.objects.select_related('campaign').order_by('-created_at')[:20]
+    return render(request, 'campaigns/dashboard.html', {
+        'campaign_stats': campaign_stats,
+        'recent_stats': recent_stats,
+        'recent_days': RECENT_DAYS,
+        'recipient_stats': recipient_stats,
+        'template_results': template_results,
+        'dispatch_jobs': dispatch_jobs,
+    })
 
 @staff_member_required
 def send_campaign_emails(request, campaign_id):
     """
-    Sends emails for a campaign.
-    Filters recipients by the campaign's specified groups and uses a randomly selected email template.
+    Queues the emails for a campaign.
+    The actual sending is done by the `dispatch_campaigns` worker, so this view
+    returns right away; progress is shown on the dashboard.
     """
     campaign = get_object_or_404(Campaign, id=campaign_id)
     
-    # Get recipients: select users whose built-in groups intersect with the campaign's groups.
-    # Note: CustomUser (derived from AbstractUser) already has a ManyToMany field 'groups'.
-    recipients = list(
-        CustomUser.objects.filter(groups__in=campaign.groups.all()).distinct()
-            .values_list('email', flat=True)
-    )
-    
-    if not recipients:
+    # Cheap sanity checks so staff get immediate feedback; the worker resolves recipients.
+    if not recipients_queryset(campaign).exists():
         messages.error(request, "No users found in the specified groups for this campaign.")
         return redirect('campaigns:dashboard')
     
-    # Get campaign templates
-    campaign_templates = list(campaign.templates.all())
-    if not campaign_templates:
+    if not campaign.templates.exists():
         messages.error(request, "No email templates are associated with this campaign.")
         return redirect('campaigns:dashboard')
     
-    num_sent = 0
-    for user_email in recipients:
-        template = random.choice(campaign_templates)
-        subject = template.subject  # From the chosen email template
-        message = template.body     # Email body from the template
-        from_email = 'no-reply@cyberapp.com'
-        try:
-            send_mail(subject, message, from_email, [user_email], fail_silently=False)
-            num_sent += 1
-        except Exception as e:
-            messages.error(request, f"Error sending email to {user_email}: {str(e)}")
-    
-    messages.success(request, f"Successfully sent emails to {num_sent} recipients for campaign '{campaign.title}'.")
-    return redirect('campaigns:dashboard')
\ No newline at end of file
+    if enqueue(campaign, requested_by=request.user) is None:
+        messages.warning(request, f"Campaign '{campaign.title}' is already being sent.")
+        return redirect('campaigns:dashboard')
+    messages.success(request, f"Emails for campaign '{campaign.title}' have been queued for sending.")
+    return redirect('campaigns:dashboard')
+
+@staff_member_required
+def export_results(request):
+    """
+    Streams the results of the user's campaigns (or of ?campaign=<id>, repeatable)
+    as ?format=csv|ndjson, gzipped with ?gzip=1.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        raise Http404
+    campaign_ids = request.GET.getlist('campaign')
+    if not all(campaign_id.isdigit() for campaign_id in campaign_ids):
+        raise Http404
+    queryset = export_queryset(request.user, campaign_ids or None)
+    return export_response(queryset, fmt, compress=request.GET.get('gzip') == '1')
@@ -2,11 +2,45 @@
 
 from django import forms
 
+from core.db_router import reporting
+from tenants.context import use_client
+
+
+class ReplicaChangelistMixin:
+    """
+    Serves changelist pages (rows, filters, counts) from the read replica, see
+    core.db_router. POSTs, i.e. actions and list_editable saves, stay on the primary.
+    """
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with reporting():
+            response = super().changelist_view(request, extra_context)
+            # The template evaluates the lazy querysets; render while still routed
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+
 class TenantAdminMixin:
     """
     Mixin for ModelAdmin classes to enforce tenant assignment.
     For non-superadmin users (i.e. request.user.client.pk != 1), the 'client' field is removed.
+    Admin views run with the user's client as the current tenant, so TenantManager
+    querysets (form choices, lookups) are scoped the same way.
     """
+    def changelist_view(self, request, extra_context=None):
+        with use_client(request.user.client):
+            return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        with use_client(request.user.client):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with use_client(request.user.client):
+            return super().delete_view(request, object_id, extra_context)
+
     def get_form(self, request, obj=None, **kwargs):
         #print("TenantAdminMixin get_form called. User client:", request.user.client)
         form = super().get_form(request, obj, **kwargs)
@@ -0,0 +1,138 @@
+"""
+Read-replica routing for reporting queries.
+
+Reads made inside `reporting()` (the dashboard, result exports, admin
+changelists) go to the DATABASE_REPLICA alias, keeping those heavy aggregates
+off the primary that takes the tracking inserts. Everything else, and every
+write, stays on the primary. Reporting reads also stay on the primary when:
+
+- the current request has written, or the browser wrote less than
+  REPLICA_STICKY_SECONDS ago (PrimaryStickinessMiddleware's cookie), so users
+  see their own changes;
+- the replica is more than REPLICA_MAX_LAG seconds behind or unreachable,
+  checked at most every REPLICA_LAG_CHECK_SECONDS per process, or every
+  REPLICA_RETRY_SECONDS after it couldn't be reached.
+
+Without the replica alias in DATABASES everything runs on the primary.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+REPLICA = getattr(settings, 'DATABASE_REPLICA', 'replica')
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 5)
+LAG_CHECK_SECONDS = getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 2)
+RETRY_SECONDS = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+
+_reporting = ContextVar('core_db_reporting', default=False)
+_pinned = ContextVar('core_db_pinned', default=False)    # Wrote recently, per the stickiness cookie
+_written = ContextVar('core_db_written', default=False)  # Wrote in this request/context
+
+_lock = threading.Lock()
+_next_check = None  # time.monotonic() of the next lag check
+_checking = False   # A thread is checking; the others use the last answer meanwhile
+_ready = False
+
+
+@contextmanager
+def reporting():
+    """Routes reads made inside it (also usable as a view decorator) to the replica."""
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+def replica_lag():
+    """How many seconds the replica's replay is behind; 0 when it's caught up or not a standby."""
+    connection = connections[REPLICA]
+    if connection.vendor != 'postgresql':
+        return 0.0  # e.g. a SQLite copy for local testing
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+            """
+        )
+        return float(cursor.fetchone()[0])
+
+
+def replica_ready():
+    """Whether the replica is configured, reachable and within REPLICA_MAX_LAG (cached briefly)."""
+    global _next_check, _checking, _ready
+    if REPLICA not in settings.DATABASES:
+        return False
+    with _lock:
+        if _checking or (_next_check is not None and time.monotonic() < _next_check):
+            return _ready
+        _checking = True
+    # Checked outside the lock: an unreachable replica can take the whole connect
+    # timeout, and only this thread should wait for it
+    wait = LAG_CHECK_SECONDS
+    ready = False
+    try:
+        ready = replica_lag() <= MAX_LAG
+    except DatabaseError:
+        wait = RETRY_SECONDS
+    finally:
+        with _lock:
+            _ready = ready
+            _next_check = time.monotonic() + wait
+            _checking = False
+    return ready
+
+
+def reporting_db():
+    """The alias reporting reads should use right now."""
+    if _written.get() or _pinned.get() or not replica_ready():
+        return DEFAULT_DB_ALIAS
+    return REPLICA
+
+
+def has_written():
+    return _written.get()
+
+
+def start_request(pinned):
+    """Resets the per-request routing state; returns tokens for end_request()."""
+    return _pinned.set(pinned), _written.set(False)
+
+
+def end_request(tokens):
+    pinned, written = tokens
+    _pinned.reset(pinned)
+    _written.reset(written)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reporting.get():
+            return reporting_db()
+        return None
+
+    def db_for_write(self, model, **hints):
+        _written.set(True)
+        # Explicitly, or Django would save an instance read from the replica back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        aliases = {DEFAULT_DB_ALIAS, REPLICA}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        if db == REPLICA:
+            return False
+        return None
@@ -0,0 +1,41 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.db_router import STICKY_SECONDS, end_request, has_written, start_request
+
+PRIMARY_COOKIE = 'db_primary'
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Keeps a browser's reporting reads on the primary for REPLICA_STICKY_SECONDS
+    after one of its requests writes, so the replica's lag can't hide the change.
+    Works natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, response):
+        if has_written():
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = start_request(PRIMARY_COOKIE in request.COOKIES)
+        try:
+            return self._finish(self.get_response(request))
+        finally:
+            end_request(tokens)
+
+    async def __acall__(self, request):
+        tokens = start_request(PRIMARY_COOKIE in request.COOKIES)
+        try:
+            return self._finish(await self.get_response(request))
+        finally:
+            end_request(tokens)
@@ -0,0 +1,178 @@
+"""
+Count-free keyset pagination for admin changelists over large tables.
+
+The stock changelist runs COUNT(*) for the total and OFFSET for each page, both
+of which get slower as the table grows. KeysetPaginationMixin instead pages by
+the admin's `keyset_fields` (e.g. newest first by timestamp, then id), so every
+page is an index range scan, and shows a total estimated from the PostgreSQL
+planner. Small results are still counted exactly.
+"""
+import json
+from datetime import datetime
+
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+AFTER_VAR = 'after'    # Cursor for older rows (next page)
+BEFORE_VAR = 'before'  # Cursor for newer rows (previous page)
+CURSOR_VARS = (AFTER_VAR, BEFORE_VAR)
+
+
+def estimated_count(queryset, exact_below=10000):
+    """
+    The planner's row estimate for `queryset` (from EXPLAIN, without running it),
+    falling back to an exact COUNT when the estimate is below `exact_below`.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count() if estimate < exact_below else estimate
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Pages `queryset` in descending order of `fields` (typically a timestamp and
+    the primary key as a tie-breaker). Cursors are the key values of the last
+    (or first) row of a page, joined with commas.
+    """
+
+    def __init__(self, queryset, per_page, fields=('-pk',)):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in fields]
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = estimated_count(self.queryset)
+        return self._count
+
+    def encode(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        return ','.join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values)
+
+    def decode(self, cursor):
+        """The key values in `cursor`; raises ValueError if it is malformed."""
+        parts = cursor.split(',')
+        if len(parts) != len(self.fields):
+            raise ValueError(cursor)
+        model = self.queryset.model
+        try:
+            values = [
+                model._meta.pk.to_python(value) if field == 'pk' else model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, parts)
+            ]
+        except ValidationError:
+            raise ValueError(cursor)
+        if None in values:
+            raise ValueError(cursor)
+        return values
+
+    def _beyond(self, values, lookup):
+        # (a, b) < (x, y)  ==  a < x OR (a = x AND b < y), in a form Django can express.
+        # The leading a <= x repeats the first term so the index scan is bounded by it.
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {f: v for f, v in zip(self.fields[:i], values[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        return Q(**{f'{self.fields[0]}__{lookup}e': values[0]}) & condition
+
+    def page(self, after=None, before=None):
+        descending = [f'-{field}' for field in self.fields]
+        if before:
+            # Newer rows: walk forwards from the cursor and flip them back
+            queryset = self.queryset.filter(self._beyond(self.decode(before), 'gt')).order_by(*self.fields)
+            rows = list(queryset[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(
+                rows, self,
+                next_cursor=self.encode(rows[-1]) if rows else None,
+                previous_cursor=self.encode(rows[0]) if rows and more else None,
+            )
+        queryset = self.queryset.order_by(*descending)
+        if after:
+            queryset = queryset.filter(self._beyond(self.decode(after), 'lt'))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows, self,
+            next_cursor=self.encode(rows[-1]) if more else None,
+            previous_cursor=self.encode(rows[0]) if after and rows else None,
+        )
+
+
+class KeysetChangeList(ChangeList):
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in CURSOR_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Changing a filter or search starts again from the newest rows
+        return super().get_query_string(new_params, [*(remove or ()), *CURSOR_VARS])
+
+    def get_results(self, request):
+        paginator = KeysetPaginator(self.queryset, self.list_per_page, self.model_admin.keyset_fields)
+        try:
+            page = paginator.page(after=request.GET.get(AFTER_VAR), before=request.GET.get(BEFORE_VAR))
+        except (ValueError, TypeError):
+            # A cursor edited by hand or from an old link: start again from the newest rows
+            page = paginator.page()
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages()
+        self.paginator = paginator
+        self.page = page
+        self.next_page_url = self.get_query_string({AFTER_VAR: page.next_cursor}) if page.has_next() else None
+        self.previous_page_url = (
+            self.get_query_string({BEFORE_VAR: page.previous_cursor}) if page.has_previous() else None
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin mixin replacing COUNT/OFFSET pagination with keyset pagination.
+    Set `keyset_fields` to an indexed, unique-together ordering, newest first.
+    Column sorting is disabled, since pages only follow that ordering.
+    """
+    keyset_fields = ('-pk',)
+    sortable_by = ()
+    show_full_result_count = False
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_ordering(self, request):
+        return self.keyset_fields
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
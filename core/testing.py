@@ -0,0 +1,51 @@
+"""
+Fixtures shared by the apps' test suites.
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from tenants.models import Client
+
+
+def make_client(pk, slug):
+    """A Client with only what the tests need; pk 1 is the superadmin tenant."""
+    return Client.objects.create(
+        pk=pk, name=slug.title(), slug=slug, contact_name='', contact_email='',
+        contact_phone='', contact_plan='', contact_payment_date='',
+    )
+
+
+class ChangelistQueriesMixin:
+    """
+    TestCase mixin checking that an admin changelist runs the same number of
+    queries however many rows it lists. Subclasses set `changelist` to the
+    changelist URL name and implement add_rows(count).
+    """
+    changelist = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = make_client(1, 'main')
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.test', 'pw', client=cls.tenant)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        raise NotImplementedError
+
+    def changelist_queries(self, url):
+        self.client.get(url)  # Warm per-process caches first
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        url = reverse(self.changelist)
+        self.add_rows(2)
+        expected = self.changelist_queries(url)
+        self.add_rows(20)
+        with self.assertNumQueries(expected):
+            self.client.get(url)
@@ -3,7 +3,8 @@ from django import forms
 #from django_ckeditor_5.widgets import CKEditor5Widget
 from django.templatetags.static import static
 from .models import EmailTemplate
-from core.admin_mixins import TenantAdminMixin
+from .rendering import invalidate
+from core.admin_mixins import ReplicaChangelistMixin, TenantAdminMixin
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
@@ -48,9 +49,11 @@ class EmailTemplateForm(forms.ModelForm):
 #        print(f"DEBUG: CKEditor Upload URL → {self.fields['body'].widget.attrs.get('data-upload-url')}")
 
 #class EmailTemplateAdmin(TenantAdminMixin, admin.ModelAdmin):
-class EmailTemplateAdmin(AdminCustomMixin, admin.ModelAdmin):
+class EmailTemplateAdmin(ReplicaChangelistMixin, AdminCustomMixin, admin.ModelAdmin):
     form = EmailTemplateForm 
     list_display = ('name', 'subject')
+    search_fields = ('^name',)  # Prefix search, served by mailtemplates_name_prefix_idx; used by autocompletes
+    ordering = ('name',)  # Served by mailtemplates_client_name_idx
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -59,4 +62,10 @@ class EmailTemplateAdmin(AdminCustomMixin, admin.ModelAdmin):
             
         return qs
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.version += 1  # New version -> recompiled on next render
+        super().save_model(request, obj, form, change)
+        invalidate(obj.pk)
+
 admin.site.register(EmailTemplate, EmailTemplateAdmin)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailtemplates', '0004_alter_emailtemplate_body_alter_emailtemplate_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtemplate',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
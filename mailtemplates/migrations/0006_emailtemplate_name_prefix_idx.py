@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:30
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('mailtemplates', '0005_emailtemplate_version'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='emailtemplate',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='mailtemplates_name_prefix_idx'),
+        ),
+    ]
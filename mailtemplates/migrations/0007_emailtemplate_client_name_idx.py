@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('mailtemplates', '0006_emailtemplate_name_prefix_idx'),
+        ('tenants', '0002_alter_client_contact_email_alter_client_contact_name_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='emailtemplate',
+            index=models.Index(fields=['client', 'name'], name='mailtemplates_client_name_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from tenants.managers import TenantManager 
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from django.apps import apps  # ✅ Lazy import
 from django.utils.translation import gettext_lazy as _
 
@@ -9,9 +11,18 @@ class EmailTemplate(models.Model):
     sender = models.CharField(max_length=255, blank=True, null=True, verbose_name=_("Sender"))  # ✅ New Sender field
     subject = models.CharField(max_length=255, verbose_name=_("Subject"))  # Email subject
     body = models.TextField(verbose_name=_("Body"))  # ✅ Use a simple TextField instead
+    version = models.PositiveIntegerField(default=1, editable=False)  # Bumped on every admin save; keys the render cache
 
     objects = TenantManager()
 
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search (name__istartswith) from the admin autocompletes
+            models.Index(OpClass(Upper('name'), name='text_pattern_ops'), name='mailtemplates_name_prefix_idx'),
+            # Per-tenant template lists and autocompletes, ordered by name
+            models.Index(fields=['client', 'name'], name='mailtemplates_client_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -0,0 +1,124 @@
+"""
+Personalization of EmailTemplate subjects and bodies.
+
+Merge fields such as {{ first_name }} or {{ tracking_url }} are resolved per
+recipient. Each template version is parsed once into literal/field segments and
+kept in an LRU cache, so rendering a recipient is a join over prebuilt pieces
+instead of a full template parse.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.html import conditional_escape
+
+# Merge fields that map onto CustomUser attributes
+USER_FIELDS = ('first_name', 'last_name', 'username', 'email', 'department', 'extension')
+# Merge fields filled in by the sender for each campaign recipient
+LINK_FIELDS = ('tracking_url', 'report_url', 'open_url')
+MERGE_FIELDS = frozenset(USER_FIELDS + LINK_FIELDS)
+
+CACHE_SIZE = getattr(settings, 'EMAIL_TEMPLATE_CACHE_SIZE', 256)
+
+_FIELD_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class CompiledText:
+    """
+    A template string split into literals and merge fields.
+    `parts` alternates literal, field, literal, ... and always starts and ends
+    with a literal (possibly empty).
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, text):
+        parts = []
+        position = 0
+        for match in _FIELD_RE.finditer(text):
+            if match.group(1) not in MERGE_FIELDS:
+                continue  # Unknown placeholders are sent as written
+            parts.append(text[position:match.start()])
+            parts.append(match.group(1))
+            position = match.end()
+        parts.append(text[position:])
+        self.parts = tuple(parts)
+
+    @property
+    def fields(self):
+        return self.parts[1::2]
+
+    def render(self, context, escape=True):
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            value = context.get(parts[i]) or ''
+            parts[i] = conditional_escape(value) if escape else str(value)
+        return ''.join(parts)
+
+
+class CompiledTemplate:
+    __slots__ = ('subject', 'body')
+
+    def __init__(self, template):
+        self.subject = CompiledText(template.subject)
+        self.body = CompiledText(template.body)
+
+    def render(self, context):
+        """Returns (subject, body) for one recipient. Values are HTML-escaped in the body only."""
+        return self.subject.render(context, escape=False), self.body.render(context)
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = LRUCache(CACHE_SIZE)
+
+
+def get_compiled(template):
+    """Returns the compiled form of `template`, parsing it only once per version."""
+    key = (template.pk, template.version)
+    compiled = _cache.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(template)
+        _cache.set(key, compiled)
+    return compiled
+
+
+def invalidate(template_pk):
+    """Drops every cached version of a template."""
+    _cache.discard(lambda key: key[0] == template_pk)
+
+
+def render(template, context):
+    """Returns the personalized (subject, body) of `template` for one recipient."""
+    return get_compiled(template).render(context)
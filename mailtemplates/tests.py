@@ -1,3 +1,70 @@
-from django.test import TestCase
+from django.contrib import admin
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from core.testing import make_client
+from . import rendering
+from .admin import EmailTemplateAdmin
+from .models import EmailTemplate
+from .rendering import LRUCache, get_compiled, invalidate, render
+
+
+class RenderingTests(SimpleTestCase):
+    def setUp(self):
+        rendering._cache.clear()
+        self.addCleanup(rendering._cache.clear)
+
+    def template(self, pk=1, version=1, subject='Hi {{ first_name }}', body='<p>{{ first_name }} {{ unknown }}</p>'):
+        return EmailTemplate(pk=pk, version=version, name='Test', subject=subject, body=body)
+
+    def test_merge_fields_are_filled_and_escaped_in_the_body_only(self):
+        subject, body = render(self.template(), {'first_name': 'Ann & <Bob>'})
+        self.assertEqual(subject, 'Hi Ann & <Bob>')
+        # Unknown placeholders are sent as written
+        self.assertEqual(body, '<p>Ann &amp; &lt;Bob&gt; {{ unknown }}</p>')
+
+    def test_each_version_is_compiled_once(self):
+        template = self.template()
+        compiled = get_compiled(template)
+        self.assertIs(get_compiled(self.template()), compiled)
+        self.assertIs(get_compiled(template), compiled)
+
+    def test_new_version_is_recompiled(self):
+        old = get_compiled(self.template())
+        edited = self.template(version=2, subject='Hello {{ first_name }}')
+        self.assertIsNot(get_compiled(edited), old)
+        self.assertEqual(render(edited, {'first_name': 'Ann'})[0], 'Hello Ann')
+        # The cache is keyed by version, so an unedited copy still gets the old text
+        self.assertEqual(render(self.template(), {'first_name': 'Ann'})[0], 'Hi Ann')
+
+    def test_invalidate_drops_every_version_of_that_template_only(self):
+        first, second, other = self.template(), self.template(version=2), self.template(pk=2)
+        compiled = [get_compiled(template) for template in (first, second, other)]
+        invalidate(1)
+        self.assertIsNot(get_compiled(first), compiled[0])
+        self.assertIsNot(get_compiled(second), compiled[1])
+        self.assertIs(get_compiled(other), compiled[2])
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+class TemplateAdminTests(TestCase):
+    def test_saving_an_edit_bumps_the_version_and_drops_the_cached_one(self):
+        template = EmailTemplate.objects.create(
+            client=make_client(1, 'main'), name='Test', subject='Hi {{ first_name }}', body='<p>Hi</p>',
+        )
+        compiled = get_compiled(template)
+        template.subject = 'Hello {{ first_name }}'
+        EmailTemplateAdmin(EmailTemplate, admin.site).save_model(None, template, None, change=True)
+
+        template.refresh_from_db()
+        self.assertEqual(template.version, 2)
+        self.assertEqual(render(template, {'first_name': 'Ann'})[0], 'Hello Ann')
+        self.assertIsNot(get_compiled(EmailTemplate(pk=template.pk, version=1, subject='', body='')), compiled)
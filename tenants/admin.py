@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.db.models import Subquery, OuterRef  # ✅ Import the missing Subquery & OuterRef
 from django.contrib.auth.models import Group
 #from .models import Client, TenantGroup, TenantAttachment, Attachment
+from core.admin_mixins import ReplicaChangelistMixin
 from .models import Client, TenantGroup
 from django.apps import apps
 #Attachment = apps.get_model('mailtemplates', 'Attachment')
@@ -88,8 +89,10 @@ class GroupForm(forms.ModelForm):
         return group
 
 
-class CustomGroupAdmin(admin.ModelAdmin):
+class CustomGroupAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('name', 'get_client', 'get_description')
+    list_select_related = ('tenant_data__client',)  # get_client/get_description read these per row
+    search_fields = ('^name',)  # Prefix search, served by tenants_group_name_prefix_idx; used by autocompletes
     form = GroupForm
 
     def get_form(self, request, obj=None, **kwargs):
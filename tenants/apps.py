@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class TenantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tenants'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .models import Client
+        from .resolver import invalidate
+        # Cached host -> client resolutions must not outlive a change to the client
+        post_save.connect(invalidate, sender=Client, dispatch_uid='tenants.resolver.save')
+        post_delete.connect(invalidate, sender=Client, dispatch_uid='tenants.resolver.delete')
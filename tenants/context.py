@@ -0,0 +1,34 @@
+"""
+The tenant (Client) the current request is acting for.
+
+Stored in a ContextVar rather than a thread local: under ASGI many requests
+share one thread, and each asyncio task (and each sync_to_async call made from
+it) gets its own copy of the context, so a tenant never leaks between requests.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_client = ContextVar('tenants_current_client', default=None)
+
+
+def get_current_client():
+    return _current_client.get()
+
+
+def set_current_client(client):
+    """Sets the tenant and returns a token for reset_current_client()."""
+    return _current_client.set(client)
+
+
+def reset_current_client(token):
+    _current_client.reset(token)
+
+
+@contextmanager
+def use_client(client):
+    """Runs the enclosed block as `client`, restoring the previous tenant afterwards."""
+    token = _current_client.set(client)
+    try:
+        yield client
+    finally:
+        _current_client.reset(token)
@@ -1,16 +1,12 @@
-import threading
 from django.db import models
 from django.contrib.auth.models import UserManager  # Import the default UserManager
 
-# Thread-local storage to hold the current client (tenant)
-_thread_locals = threading.local()
-
-def get_current_client():
-    return getattr(_thread_locals, 'client', None)
+from .context import get_current_client
 
 class TenantManager(UserManager):
     def get_queryset(self):
         client = get_current_client()
-        if client:
+        # The superadmin client (pk=1) sees every tenant, as in the admin
+        if client and client.pk != 1:
             return super().get_queryset().filter(client=client)
         return super().get_queryset()
@@ -1,30 +1,50 @@
-import threading
-from tenants.models import Client
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 
-_thread_locals = threading.local()
+from tenants.context import reset_current_client, set_current_client
+from tenants.resolver import cached_client, resolve_client
 
-def get_current_client():
-    return getattr(_thread_locals, 'client', None)
+_missing = object()
 
 class TenantMiddleware:
+    """
+    Resolves the tenant from the host and sets it in tenants.context for the
+    duration of the request. Works natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def _host_key(self, request):
         # Example: use subdomain as the client's slug.
         host = request.get_host().split(':')[0]
         subdomain = host.split('.')[0]  # Assuming URL like client.example.com
-        try:
-            client = Client.objects.get(slug=subdomain)
-        except Client.DoesNotExist:
-            #client = None
-            #client = Client.objects.first()  
-            if request.path.startswith('/admin/'):
-                client = Client.objects.get(pk=1)
-            else:
-                client = Client.objects.first()
-        _thread_locals.client = client
+        return subdomain, request.path.startswith('/admin/')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Served from the resolver's cache; only a miss queries the database
+        client = resolve_client(*self._host_key(request))
+        token = set_current_client(client)
         request.client = client  # Optionally attach to the request
-        response = self.get_response(request)
-        #print("TenantMiddleware set client:", client)  # Debug print
-        return response
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_client(token)
+
+    async def __acall__(self, request):
+        subdomain, admin = self._host_key(request)
+        client = cached_client(subdomain, admin, _missing)
+        if client is _missing:
+            client = await sync_to_async(resolve_client)(subdomain, admin)
+        # Each ASGI request runs in its own task, so this doesn't leak into concurrent requests
+        token = set_current_client(client)
+        request.client = client
+        try:
+            return await self.get_response(request)
+        finally:
+            reset_current_client(token)
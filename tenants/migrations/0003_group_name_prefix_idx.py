@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    auth.Group belongs to Django, so its index for the group autocomplete
+    (name__istartswith, i.e. UPPER(name) LIKE 'X%') is created here, without
+    blocking writes to the table while it builds.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tenants', '0002_alter_client_contact_email_alter_client_contact_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS tenants_group_name_prefix_idx ON auth_group (UPPER(name) text_pattern_ops);',
+            'DROP INDEX CONCURRENTLY IF EXISTS tenants_group_name_prefix_idx;',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tenants', '0003_group_name_prefix_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='tenantgroup',
+            index=models.Index(fields=['client', 'group'], name='tenants_group_client_idx'),
+        ),
+    ]
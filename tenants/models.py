@@ -33,6 +33,12 @@ class TenantGroup(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     description = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Group.objects.filter(tenant_data__client=...) reads both columns from the index
+            models.Index(fields=['client', 'group'], name='tenants_group_client_idx'),
+        ]
+
     def __str__(self):
         desc_part = f" - {self.description[:30]}..." if self.description else ""
         return f"{self.group.name} ({self.client.name}){desc_part}"
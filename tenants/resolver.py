@@ -0,0 +1,110 @@
+"""
+Host to Client resolution for TenantMiddleware.
+
+Resolved clients are kept in an in-process LRU cache for TENANT_CACHE_TTL
+seconds, so in steady state a request resolves its tenant without a query.
+Saving or deleting a Client clears the cache (see TenantsConfig.ready).
+
+With several worker processes, set TENANT_SHARED_CACHE to a CACHES alias
+(e.g. Redis or Memcached) to share lookups between them. Entries there are keyed
+by a generation number that every Client change bumps, so other workers see
+changes as soon as their local entries expire.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Client
+
+CACHE_SIZE = getattr(settings, 'TENANT_CACHE_SIZE', 1024)
+CACHE_TTL = getattr(settings, 'TENANT_CACHE_TTL', 300)
+SHARED_CACHE = getattr(settings, 'TENANT_SHARED_CACHE', None)
+
+_GENERATION_KEY = 'tenants:generation'
+
+
+class TTLCache:
+    """A small thread-safe LRU mapping whose entries expire after `ttl` seconds."""
+
+    _missing = object()
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            expires, value = self._data.get(key, (0, self._missing))
+            if value is self._missing or expires < time.monotonic():
+                self._data.pop(key, None)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = TTLCache(CACHE_SIZE, CACHE_TTL)
+_missing = object()
+
+
+def _shared_key(key):
+    cache = caches[SHARED_CACHE]
+    generation = cache.get_or_set(_GENERATION_KEY, 1, timeout=None)
+    return cache, f'tenants:client:{generation}:{key[0]}:{int(key[1])}'
+
+
+def _lookup(subdomain, admin):
+    try:
+        return Client.objects.get(slug=subdomain)
+    except Client.DoesNotExist:
+        # The admin falls back to the superadmin client, everything else to the first one
+        return Client.objects.get(pk=1) if admin else Client.objects.first()
+
+
+def cached_client(subdomain, admin=False, default=None):
+    """The resolution held in this process's cache, or `default`; never does I/O."""
+    return _local.get((subdomain, admin), default)
+
+
+def resolve_client(subdomain, admin=False):
+    """The Client serving `subdomain`, falling back as TenantMiddleware always has."""
+    key = (subdomain, admin)
+    client = _local.get(key, _missing)
+    if client is not _missing:
+        return client
+    if SHARED_CACHE:
+        cache, shared_key = _shared_key(key)
+        client = cache.get(shared_key, _missing)
+        if client is _missing:
+            client = _lookup(subdomain, admin)
+            cache.set(shared_key, client, CACHE_TTL)
+    else:
+        client = _lookup(subdomain, admin)
+    _local.set(key, client)
+    return client
+
+
+def invalidate(**kwargs):
+    """Signal receiver for Client changes: drops every cached resolution."""
+    _local.clear()
+    if SHARED_CACHE:
+        cache = caches[SHARED_CACHE]
+        try:
+            cache.incr(_GENERATION_KEY)
+        except ValueError:
+            cache.set(_GENERATION_KEY, 1, timeout=None)
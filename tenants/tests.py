@@ -1,3 +1,146 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import Group
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from core.testing import ChangelistQueriesMixin, make_client
+from . import resolver
+from .context import get_current_client, use_client
+from .middleware import TenantMiddleware
+from .models import TenantGroup
+from .resolver import TTLCache, cached_client, invalidate, resolve_client
+
+
+class GroupChangelistTests(ChangelistQueriesMixin, TestCase):
+    changelist = 'admin:auth_group_changelist'
+
+    def add_rows(self, count):
+        for i in range(count):
+            group = Group.objects.create(name=f'Group {Group.objects.count()}')
+            TenantGroup.objects.create(group=group, client=self.tenant, description=f'Description {i}')
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_entries_expire(self):
+        cache = TTLCache(2, ttl=10)
+        with mock.patch('tenants.resolver.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('tenants.resolver.time.monotonic', return_value=109):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('tenants.resolver.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+class ResolverTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = make_client(1, 'main')
+        cls.acme = make_client(2, 'acme')
+
+    def setUp(self):
+        resolver._local.clear()
+        self.addCleanup(resolver._local.clear)
+
+    def test_resolutions_are_cached(self):
+        self.assertIsNone(cached_client('acme'))
+        self.assertEqual(resolve_client('acme'), self.acme)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_client('acme'), self.acme)
+        self.assertEqual(cached_client('acme'), self.acme)
+
+    def test_unknown_hosts_fall_back(self):
+        self.assertEqual(resolve_client('www', admin=True), self.main)
+        self.assertEqual(resolve_client('www'), self.main)
+        self.assertEqual(resolve_client('acme', admin=True), self.acme)
+
+    def test_saving_a_client_drops_cached_resolutions(self):
+        resolve_client('acme')
+        self.acme.slug = 'acme-corp'
+        self.acme.save()
+        self.assertIsNone(cached_client('acme'))
+        self.assertEqual(resolve_client('acme-corp'), self.acme)
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_cache_is_used_across_processes_until_a_change(self):
+        with mock.patch('tenants.resolver.SHARED_CACHE', 'shared'):
+            resolve_client('acme')
+            resolver._local.clear()  # As seen from another process
+            with self.assertNumQueries(0):
+                self.assertEqual(resolve_client('acme'), self.acme)
+            invalidate()
+            with self.assertNumQueries(1):
+                resolve_client('acme')
+
+
+@override_settings(ALLOWED_HOSTS=['.example.test'])
+class TenantContextTests(SimpleTestCase):
+    def test_use_client_restores_the_previous_tenant(self):
+        with use_client('outer'):
+            with use_client('inner'):
+                self.assertEqual(get_current_client(), 'inner')
+            self.assertEqual(get_current_client(), 'outer')
+        self.assertIsNone(get_current_client())
+
+    async def test_concurrent_tasks_keep_their_own_tenant(self):
+        both_set = asyncio.Barrier(2)
+
+        async def run_as(client):
+            with use_client(client):
+                # Each task waits until the other has set its tenant too
+                await both_set.wait()
+                seen = [get_current_client(), await sync_to_async(get_current_client)()]
+            return seen
+
+        results = await asyncio.gather(run_as('acme'), run_as('globex'))
+        self.assertEqual(results, [['acme', 'acme'], ['globex', 'globex']])
+        self.assertIsNone(get_current_client())
+
+
+class TenantMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = make_client(1, 'main')
+        cls.acme = make_client(2, 'acme')
+
+    def setUp(self):
+        resolver._local.clear()
+        self.addCleanup(resolver._local.clear)
+
+    def test_request_runs_as_the_hosts_client(self):
+        seen = []
+
+        def view(request):
+            seen.append((request.client, get_current_client()))
+            return HttpResponse()
+
+        TenantMiddleware(view)(RequestFactory().get('/', HTTP_HOST='acme.example.test'))
+        self.assertEqual(seen, [(self.acme, self.acme)])
+        self.assertIsNone(get_current_client())
+
+    async def test_concurrent_async_requests_keep_their_own_client(self):
+        both_started = asyncio.Barrier(2)
+
+        async def view(request):
+            await both_started.wait()
+            return HttpResponse(str(get_current_client().pk))
+
+        middleware = TenantMiddleware(view)
+        factory = RequestFactory()
+        responses = await asyncio.gather(
+            middleware(factory.get('/', HTTP_HOST='acme.example.test')),
+            middleware(factory.get('/', HTTP_HOST='main.example.test')),
+        )
+        self.assertEqual([response.content for response in responses], [b'2', b'1'])
+        self.assertIsNone(get_current_client())